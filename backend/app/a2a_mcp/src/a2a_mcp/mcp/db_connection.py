@@ -76,14 +76,14 @@ class VectorSearchService:
                             cse.created_at,
                             css.name as session_name,
                             css.github_url,
-                            1 - (cse.embedding_vector <=> :query_embedding) as similarity
+                            1 - (cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768))) as similarity
                         FROM codesearchembedding cse
                         JOIN codesearchsession css ON cse.session_id = css.id
                         WHERE 
                             cse.session_id = :session_id_filter
                             AND cse.embedding_vector IS NOT NULL
-                            AND (1 - (cse.embedding_vector <=> :query_embedding)) >= :similarity_threshold
-                        ORDER BY cse.embedding_vector <=> :query_embedding
+                            AND (1 - (cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768)))) >= :similarity_threshold
+                        ORDER BY cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768))
                         LIMIT :limit_val
                     """)
                     
@@ -109,13 +109,13 @@ class VectorSearchService:
                             cse.created_at,
                             css.name as session_name,
                             css.github_url,
-                            1 - (cse.embedding_vector <=> :query_embedding) as similarity
+                            1 - (cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768))) as similarity
                         FROM codesearchembedding cse
                         JOIN codesearchsession css ON cse.session_id = css.id
                         WHERE 
                             cse.embedding_vector IS NOT NULL
-                            AND (1 - (cse.embedding_vector <=> :query_embedding)) >= :similarity_threshold
-                        ORDER BY cse.embedding_vector <=> :query_embedding
+                            AND (1 - (cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768)))) >= :similarity_threshold
+                        ORDER BY cse.embedding_vector <=> CAST(:query_embedding AS halfvec(768))
                         LIMIT :limit_val
                     """)
                     
@@ -337,4 +337,100 @@ class VectorSearchService:
                 
         except Exception as e:
             logger.error(f"Error searching by file path: {e}")
+            raise
+    
+    async def search_by_file_paths_batch(
+        self, 
+        file_path_patterns: List[str], 
+        session_id: Optional[uuid.UUID] = None,
+        per_pattern_limit: int = 100
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Search for code chunks matching several file path patterns in one query.
+        
+        All patterns are sent as a single array and joined laterally against the
+        embeddings table, so N patterns cost one round-trip instead of N. Each
+        pattern's lookup stops after its first `per_pattern_limit` chunks.
+        
+        Args:
+            file_path_patterns: SQL LIKE patterns for file paths
+            session_id: Optional session ID to filter results
+            per_pattern_limit: Maximum number of chunks returned per pattern
+            
+        Returns:
+            Mapping of each pattern to its list of matching code chunks
+        """
+        results: Dict[str, List[Dict[str, Any]]] = {
+            pattern: [] for pattern in file_path_patterns
+        }
+        if not file_path_patterns:
+            return results
+        
+        try:
+            with get_mcp_session() as session:
+                query = text("""
+                    SELECT 
+                        p.pattern,
+                        m.id,
+                        m.session_id,
+                        m.file_path,
+                        m.file_content,
+                        m.chunk_index,
+                        m.chunk_size,
+                        m.file_metadata,
+                        m.created_at,
+                        m.session_name,
+                        m.github_url
+                    FROM unnest(CAST(:file_path_patterns AS text[])) AS p(pattern)
+                    CROSS JOIN LATERAL (
+                        SELECT 
+                            cse.id,
+                            cse.session_id,
+                            cse.file_path,
+                            cse.file_content,
+                            cse.chunk_index,
+                            cse.chunk_size,
+                            cse.file_metadata,
+                            cse.created_at,
+                            css.name as session_name,
+                            css.github_url
+                        FROM codesearchembedding cse
+                        JOIN codesearchsession css ON cse.session_id = css.id
+                        WHERE 
+                            cse.file_path ILIKE p.pattern
+                            AND (CAST(:session_id_filter AS uuid) IS NULL
+                                 OR cse.session_id = CAST(:session_id_filter AS uuid))
+                        ORDER BY cse.file_path, cse.chunk_index
+                        LIMIT :per_pattern_limit
+                    ) m
+                    ORDER BY p.pattern, m.file_path, m.chunk_index
+                """)
+                
+                result = session.execute(
+                    query,
+                    {
+                        'file_path_patterns': list(file_path_patterns),
+                        'session_id_filter': str(session_id) if session_id else None,
+                        'per_pattern_limit': per_pattern_limit
+                    }
+                )
+                
+                for row in result:
+                    results[row.pattern].append({
+                        'id': str(row.id),
+                        'session_id': str(row.session_id),
+                        'session_name': row.session_name,
+                        'github_url': row.github_url,
+                        'file_path': row.file_path,
+                        'file_content': row.file_content,
+                        'chunk_index': row.chunk_index,
+                        'chunk_size': row.chunk_size,
+                        'file_metadata': row.file_metadata,
+                        'created_at': row.created_at.isoformat()
+                    })
+                
+                return results
+                
+        except Exception as e:
+            logger.error(f"Error searching by file path batch: {e}")
             raise 
@@ -0,0 +1,202 @@
+"""
+In-process similarity cache for vector search queries.
+Repeated and near-duplicate queries are answered without calling the embedding
+API or scanning pgvector again.
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class _CacheEntry:
+    """A cached query: its embedding, results per search parameters and usage stats"""
+    slot: int
+    embedding: List[float]
+    results: Dict[Hashable, Tuple[float, List[Dict[str, Any]]]] = field(default_factory=dict)
+    hits: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class QuerySimilarityCache:
+    """
+    Cache of vector search results keyed by query text and query embedding.
+
+    Lookups happen in two tiers:
+    - Exact: a hash of the normalized query text returns the cached embedding
+      (skipping the embedding API) and, if present, the cached results.
+    - Similar: the query embedding is compared against all cached embeddings
+      with a single matrix-vector product; a cosine similarity above the
+      threshold reuses that entry's results (skipping the pgvector scan).
+
+    When full, the entry with the fewest hits is evicted, ties broken by the
+    oldest last use. Results expire after `ttl_seconds` so re-processed
+    sessions are eventually picked up.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        similarity_threshold: float = 0.98,
+        ttl_seconds: float = 300.0
+    ):
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: Dict[bytes, _CacheEntry] = {}
+        self._slot_keys: List[Optional[bytes]] = [None] * max_entries
+        self._free_slots: List[int] = list(range(max_entries - 1, -1, -1))
+        # Normalized embeddings, one row per slot; allocated on first insert
+        self._matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str) -> bytes:
+        normalized = " ".join(query.lower().split())
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+    def _fresh_results(
+        self, entry: _CacheEntry, params: Hashable
+    ) -> Optional[List[Dict[str, Any]]]:
+        cached = entry.results.get(params)
+        if cached is None:
+            return None
+        stored_at, results = cached
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del entry.results[params]
+            return None
+        return results
+
+    def _touch(self, entry: _CacheEntry) -> None:
+        entry.hits += 1
+        entry.last_used = time.monotonic()
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        """Return the cached embedding for an exact (normalized) query match"""
+        with self._lock:
+            entry = self._entries.get(self._key(query))
+            return entry.embedding if entry else None
+
+    def get(self, query: str, params: Hashable) -> Optional[List[Dict[str, Any]]]:
+        """Return cached results for an exact (normalized) query match"""
+        with self._lock:
+            entry = self._entries.get(self._key(query))
+            if entry is None:
+                return None
+            results = self._fresh_results(entry, params)
+            if results is not None:
+                self._touch(entry)
+                self.exact_hits += 1
+            return results
+
+    def get_similar(
+        self, embedding: List[float], params: Hashable
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Return cached results of the most similar cached query above the threshold"""
+        with self._lock:
+            if self._matrix is None or not self._entries:
+                self.misses += 1
+                return None
+
+            query_vec = self._normalize(embedding)
+            if query_vec is None or query_vec.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            scores = self._matrix @ query_vec
+            # Free slots hold zero rows and never pass the threshold
+            for slot in np.argsort(scores)[::-1]:
+                if scores[slot] < self.similarity_threshold:
+                    break
+                key = self._slot_keys[slot]
+                if key is None:
+                    continue
+                entry = self._entries[key]
+                results = self._fresh_results(entry, params)
+                if results is not None:
+                    self._touch(entry)
+                    self.similar_hits += 1
+                    return results
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        query: str,
+        embedding: List[float],
+        params: Hashable,
+        results: List[Dict[str, Any]]
+    ) -> None:
+        """Store the embedding and results for a query"""
+        query_vec = self._normalize(embedding)
+        if query_vec is None:
+            return
+
+        with self._lock:
+            key = self._key(query)
+            entry = self._entries.get(key)
+            if entry is None:
+                if self._matrix is None:
+                    self._matrix = np.zeros(
+                        (self.max_entries, query_vec.shape[0]), dtype=np.float32
+                    )
+                elif query_vec.shape[0] != self._matrix.shape[1]:
+                    return
+                if not self._free_slots:
+                    self._evict()
+                slot = self._free_slots.pop()
+                self._matrix[slot] = query_vec
+                self._slot_keys[slot] = key
+                entry = _CacheEntry(slot=slot, embedding=list(embedding))
+                self._entries[key] = entry
+            entry.results[params] = (time.monotonic(), results)
+            entry.last_used = time.monotonic()
+
+    def _evict(self) -> None:
+        """Evict the least frequently used entry, oldest first on ties"""
+        key, entry = min(
+            self._entries.items(), key=lambda item: (item[1].hits, item[1].last_used)
+        )
+        del self._entries[key]
+        self._matrix[entry.slot] = 0.0
+        self._slot_keys[entry.slot] = None
+        self._free_slots.append(entry.slot)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> Optional[np.ndarray]:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if vec.ndim != 1 or norm == 0:
+            return None
+        return vec / norm
+
+    def clear(self) -> None:
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._slot_keys = [None] * self.max_entries
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+            if self._matrix is not None:
+                self._matrix.fill(0.0)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+            }
@@ -17,6 +17,7 @@ from ..mcp_config import mcp_settings
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp.utilities.logging import get_logger
 from .db_connection import VectorSearchService
+from .query_cache import QuerySimilarityCache
 import weave
 
 logger = get_logger(__name__)
@@ -156,6 +157,9 @@ def serve(host, port, transport):  # noqa: PLR0915
         logger.warning(f"Vector search service not available: {e}")
         vector_search_service = None
 
+    # Repeated / near-duplicate vector search queries are served from memory
+    search_cache = QuerySimilarityCache()
+
     @mcp.tool(
         name="find_agent",
         description="Finds the most relevant agent card based on a natural language query string.",
@@ -675,42 +679,55 @@ def serve(host, port, transport):  # noqa: PLR0915
                 except ValueError:
                     return json.dumps({"error": "Invalid session_id format. Must be a valid UUID."})
             
-            # Generate embedding for the query
-            query_embedding = genai.embed_content(
-                model=VECTOR_EMBEDDING_MODEL,
-                content=query,
-                output_dimensionality=768
-            )
+            search_params = (session_uuid, limit, similarity_threshold)
             
-            # Perform the search
-            try:
-                # Try to run in existing event loop context
-                results = asyncio.run(
-                    vector_search_service.search_similar_code(
-                        query_embedding=query_embedding['embedding'],
-                        session_id=session_uuid,
-                        limit=limit,
-                        similarity_threshold=similarity_threshold
-                    )
-                )
-            except RuntimeError:
-                # If there's already a loop running, use asyncio.create_task() approach
-                import concurrent.futures
-                import threading
+            # Exact repeat of a previous query: skip embedding and search
+            results = search_cache.get(query, search_params)
+            if results is None:
+                # Generate embedding for the query (reused if the text was seen before)
+                query_embedding = search_cache.get_embedding(query)
+                if query_embedding is None:
+                    query_embedding = genai.embed_content(
+                        model=VECTOR_EMBEDDING_MODEL,
+                        content=query,
+                        output_dimensionality=768
+                    )['embedding']
                 
-                def run_async():
-                    return asyncio.run(
+                # Near-duplicate of a previous query: skip the search
+                results = search_cache.get_similar(query_embedding, search_params)
+            
+            if results is None:
+                # Perform the search
+                try:
+                    # Try to run in existing event loop context
+                    results = asyncio.run(
                         vector_search_service.search_similar_code(
-                            query_embedding=query_embedding['embedding'],
+                            query_embedding=query_embedding,
                             session_id=session_uuid,
                             limit=limit,
                             similarity_threshold=similarity_threshold
                         )
                     )
+                except RuntimeError:
+                    # If there's already a loop running, use asyncio.create_task() approach
+                    import concurrent.futures
+                    import threading
+                    
+                    def run_async():
+                        return asyncio.run(
+                            vector_search_service.search_similar_code(
+                                query_embedding=query_embedding,
+                                session_id=session_uuid,
+                                limit=limit,
+                                similarity_threshold=similarity_threshold
+                            )
+                        )
+                    
+                    with concurrent.futures.ThreadPoolExecutor() as executor:
+                        future = executor.submit(run_async)
+                        results = future.result()
                 
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(run_async)
-                    results = future.result()
+                search_cache.put(query, query_embedding, search_params, results)
             
             # Format results
             response = {
@@ -0,0 +1,92 @@
+"""
+Unit tests for the MCP server's query similarity cache.
+These run without a database or the embedding API.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the src directory to the path so we can import our modules
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+from a2a_mcp.mcp import query_cache
+from a2a_mcp.mcp.query_cache import QuerySimilarityCache
+
+PARAMS = ("session-1", 5, 0.7)
+RESULTS = [{"file_path": "app/main.py", "similarity": 0.91}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.monotonic for the cache module"""
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = QuerySimilarityCache(max_entries=4)
+    cache.put("Find the  login handler", [1.0, 0.0, 0.0], PARAMS, RESULTS)
+
+    assert cache.get("find the login handler", PARAMS) == RESULTS
+    assert cache.get_embedding("FIND THE LOGIN HANDLER") == [1.0, 0.0, 0.0]
+    # Results are kept per search parameters
+    assert cache.get("find the login handler", ("session-2", 5, 0.7)) is None
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_similar_hit_above_threshold():
+    cache = QuerySimilarityCache(max_entries=4, similarity_threshold=0.98)
+    cache.put("login handler", [1.0, 0.0, 0.0], PARAMS, RESULTS)
+
+    # Cosine similarity ~0.995
+    assert cache.get_similar([1.0, 0.1, 0.0], PARAMS) == RESULTS
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_similar_miss_below_threshold():
+    cache = QuerySimilarityCache(max_entries=4, similarity_threshold=0.98)
+    cache.put("login handler", [1.0, 0.0, 0.0], PARAMS, RESULTS)
+
+    # Cosine similarity ~0.894
+    assert cache.get_similar([1.0, 0.5, 0.0], PARAMS) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_results_expire_after_ttl(clock):
+    cache = QuerySimilarityCache(max_entries=4, ttl_seconds=300.0)
+    cache.put("login handler", [1.0, 0.0, 0.0], PARAMS, RESULTS)
+
+    clock[0] += 299.0
+    assert cache.get("login handler", PARAMS) == RESULTS
+
+    clock[0] += 2.0
+    assert cache.get("login handler", PARAMS) is None
+    assert cache.get_similar([1.0, 0.0, 0.0], PARAMS) is None
+    # The embedding outlives its results, so the API call is still skipped
+    assert cache.get_embedding("login handler") == [1.0, 0.0, 0.0]
+
+
+def test_evicts_least_frequently_used_then_oldest(clock):
+    cache = QuerySimilarityCache(max_entries=3)
+    cache.put("a", [1.0, 0.0, 0.0], PARAMS, RESULTS)
+    clock[0] += 1.0
+    cache.put("b", [0.0, 1.0, 0.0], PARAMS, RESULTS)
+    clock[0] += 1.0
+    cache.put("c", [0.0, 0.0, 1.0], PARAMS, RESULTS)
+    clock[0] += 1.0
+    cache.get("a", PARAMS)
+
+    # b and c have no hits; b was used longest ago
+    cache.put("d", [1.0, 1.0, 0.0], PARAMS, RESULTS)
+    assert cache.get_embedding("b") is None
+    assert [cache.get_embedding(q) is not None for q in ("a", "c", "d")] == [True] * 3
+
+    # a's hit keeps it over c, and d's put is more recent than c's
+    cache.put("e", [0.0, 1.0, 1.0], PARAMS, RESULTS)
+    assert cache.get_embedding("c") is None
+    assert cache.stats()["entries"] == 3
+    # The evicted slot is cleared, so its old embedding no longer matches
+    assert cache.get_similar([0.0, 1.0, 0.0], PARAMS) is None
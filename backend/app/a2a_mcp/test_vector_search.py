@@ -16,21 +16,31 @@ from a2a_mcp.mcp.db_connection import VectorSearchService, get_mcp_session
 from a2a_mcp.mcp_config import mcp_settings
 
 
+async def run_blocking(fn, *args):
+    """Run a blocking callable in the default thread pool so gathered tests overlap."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+def _sync_check_conn():
+    """Run a trivial query over a synchronous database session."""
+    with get_mcp_session() as session:
+        # Simple query to test connection  
+        from sqlmodel import text
+        result = session.exec(text("SELECT 1 as test"))
+        row = result.first()
+        return bool(row and row.test == 1)
+
+
 async def test_database_connection():
     """Test basic database connection."""
     print("Testing database connection...")
     try:
-        with get_mcp_session() as session:
-            # Simple query to test connection  
-            from sqlmodel import text
-            result = session.exec(text("SELECT 1 as test"))
-            row = result.first()
-            if row and row.test == 1:
-                print("✅ Database connection successful")
-                return True
-            else:
-                print("❌ Database connection failed: unexpected result")
-                return False
+        if await run_blocking(_sync_check_conn):
+            print("✅ Database connection successful")
+            return True
+        else:
+            print("❌ Database connection failed: unexpected result")
+            return False
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
         return False
@@ -40,7 +50,7 @@ async def test_vector_search_service():
     """Test vector search service initialization."""
     print("\nTesting VectorSearchService initialization...")
     try:
-        service = VectorSearchService()
+        service = await run_blocking(VectorSearchService)
         print("✅ VectorSearchService initialized successfully")
         return service
     except Exception as e:
@@ -52,8 +62,9 @@ async def test_get_sessions():
     """Test getting sessions with embeddings."""
     print("\nTesting get_sessions_with_embeddings...")
     try:
-        service = VectorSearchService()
-        sessions = await service.get_sessions_with_embeddings()
+        service = await run_blocking(VectorSearchService)
+        # VectorSearchService still uses sync sessions, so run it off the loop
+        sessions = await run_blocking(asyncio.run, service.get_sessions_with_embeddings())
         print(f"✅ Found {len(sessions)} sessions with embeddings")
         
         if sessions:
@@ -75,19 +86,23 @@ async def test_search_functionality():
     """Test basic search functionality if embeddings exist."""
     print("\nTesting search functionality...")
     try:
-        service = VectorSearchService()
-        sessions = await service.get_sessions_with_embeddings()
+        service = await run_blocking(VectorSearchService)
+        sessions = await run_blocking(asyncio.run, service.get_sessions_with_embeddings())
         
         if not sessions:
             print("ℹ️  No sessions with embeddings found - skipping search test")
             return True
         
-        # Test file path search
-        results = await service.search_by_file_path("%.py")
-        print(f"✅ File path search returned {len(results)} Python files")
-        
-        if results:
-            print(f"  Example file: {results[0]['file_path']}")
+        # Test file path search (all patterns in a single round-trip)
+        patterns = ["%.py", "%.ts", "%.md"]
+        results_by_pattern = await run_blocking(
+            asyncio.run, service.search_by_file_paths_batch(patterns)
+        )
+        for pattern, results in results_by_pattern.items():
+            print(f"✅ File path search for '{pattern}' returned {len(results)} chunks")
+
+            if results:
+                print(f"  Example file: {results[0]['file_path']}")
         
         return True
     except Exception as e:
@@ -0,0 +1,91 @@
+"""add_code_search_session_owner_indexes
+
+Revision ID: 43b196575c5e
+Revises: 062ca8c2dba2
+Create Date: 2025-07-20 14:12:05.318422
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '43b196575c5e'
+down_revision = '062ca8c2dba2'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Each session with a github_url and the session its (owner_id, github_url)
+# group keeps: the one with the most embeddings, then the most recently used
+_SESSION_KEEP_IDS = """
+    SELECT s.id, first_value(s.id) OVER (
+        PARTITION BY s.owner_id, s.github_url
+        ORDER BY (
+            SELECT count(*) FROM codesearchembedding e WHERE e.session_id = s.id
+        ) DESC, s.last_used DESC, s.created_at DESC, s.id
+    ) AS keep_id
+    FROM codesearchsession s
+    WHERE s.github_url IS NOT NULL
+"""
+
+
+def upgrade():
+    # The unique constraint needs duplicate sessions merged first: their
+    # embeddings move to the kept session, then the emptied rows are deleted
+    bind = op.get_bind()
+    session_count, embedding_count = bind.execute(sa.text(f"""
+        SELECT
+            (SELECT count(*) FROM ({_SESSION_KEEP_IDS}) k WHERE k.id <> k.keep_id),
+            (SELECT count(*) FROM codesearchembedding e
+             JOIN ({_SESSION_KEEP_IDS}) k ON k.id = e.session_id
+             WHERE k.id <> k.keep_id)
+    """)).one()
+    if session_count:
+        logger.warning(
+            "Merging %d duplicate code search sessions (%d embeddings moved) "
+            "before adding uq_codesearchsession_owner_id_github_url",
+            session_count,
+            embedding_count,
+        )
+        op.execute(f"""
+            UPDATE codesearchembedding e SET session_id = k.keep_id
+            FROM ({_SESSION_KEEP_IDS}) k
+            WHERE e.session_id = k.id AND k.id <> k.keep_id
+        """)
+        op.execute(f"""
+            UPDATE codesearchsession s SET vector_embeddings_processed = true
+            WHERE s.id IN (
+                SELECT k.keep_id FROM ({_SESSION_KEEP_IDS}) k
+                JOIN codesearchsession d ON d.id = k.id
+                WHERE d.vector_embeddings_processed
+            )
+        """)
+        # Duplicates now hold no embeddings, so nothing cascades
+        op.execute(f"""
+            DELETE FROM codesearchsession WHERE id IN (
+                SELECT k.id FROM ({_SESSION_KEEP_IDS}) k WHERE k.id <> k.keep_id
+            )
+        """)
+
+    op.create_index(
+        'ix_codesearchsession_owner_id_last_used',
+        'codesearchsession',
+        ['owner_id', sa.text('last_used DESC')],
+        unique=False,
+    )
+    op.create_unique_constraint(
+        'uq_codesearchsession_owner_id_github_url',
+        'codesearchsession',
+        ['owner_id', 'github_url'],
+    )
+
+
+def downgrade():
+    # Merged duplicate sessions stay merged; no embeddings were removed
+    op.drop_constraint('uq_codesearchsession_owner_id_github_url', 'codesearchsession', type_='unique')
+    op.drop_index('ix_codesearchsession_owner_id_last_used', table_name='codesearchsession')
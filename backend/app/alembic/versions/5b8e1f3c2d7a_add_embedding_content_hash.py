@@ -0,0 +1,27 @@
+"""add_embedding_content_hash
+
+Revision ID: 5b8e1f3c2d7a
+Revises: 7f3d2a9c4e1b
+Create Date: 2025-07-22 14:12:05.381927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1f3c2d7a'
+down_revision = '7f3d2a9c4e1b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('codesearchembedding', sa.Column('content_hash', sqlmodel.sql.sqltypes.AutoString(length=32), nullable=True))
+    op.create_index(op.f('ix_codesearchembedding_content_hash'), 'codesearchembedding', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_codesearchembedding_content_hash'), table_name='codesearchembedding')
+    op.drop_column('codesearchembedding', 'content_hash')
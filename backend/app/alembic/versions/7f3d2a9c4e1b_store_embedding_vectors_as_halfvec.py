@@ -0,0 +1,42 @@
+"""store_embedding_vectors_as_halfvec
+
+Revision ID: 7f3d2a9c4e1b
+Revises: 43b196575c5e
+Create Date: 2025-07-21 09:41:27.550318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from pgvector.sqlalchemy import HALFVEC, Vector
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3d2a9c4e1b'
+down_revision = '43b196575c5e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # halfvec requires pgvector >= 0.7
+    op.alter_column('codesearchembedding', 'embedding_vector',
+               existing_type=Vector(dim=768),
+               type_=HALFVEC(dim=768),
+               existing_nullable=True,
+               postgresql_using='embedding_vector::halfvec(768)')
+
+    # Approximate nearest neighbour index for cosine distance (<=>) searches
+    op.execute(
+        "CREATE INDEX ix_codesearchembedding_embedding_vector_hnsw "
+        "ON codesearchembedding USING hnsw (embedding_vector halfvec_cosine_ops)"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_codesearchembedding_embedding_vector_hnsw', table_name='codesearchembedding')
+    op.alter_column('codesearchembedding', 'embedding_vector',
+               existing_type=HALFVEC(dim=768),
+               type_=Vector(dim=768),
+               existing_nullable=True,
+               postgresql_using='embedding_vector::vector(768)')
@@ -1,12 +1,16 @@
-from typing import Any, Dict, List
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
 import json
 import logging
 import asyncio
+import time
 from contextlib import asynccontextmanager
 
+import orjson
+
 from app.services.agent_service import agent_service
 from app.api.deps import get_current_user
 from app.models import User
@@ -15,6 +19,34 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["agents"])
 
+# Agent status only changes when an agent is first initialized, so the
+# serialized /agents/status payload is shared across requests for a short TTL
+_STATUS_CACHE_TTL_SECONDS = 1.0
+_STATUS_FIELDS = (
+    "agent_name",
+    "agent_type",
+    "status",
+    "description",
+    "capabilities",
+    "is_active",
+)
+_status_cache: Optional[Tuple[float, bytes]] = None
+
+# Agent types the agent service can dispatch to, checked before any agent work
+_VALID_AGENTS = frozenset(agent_service.agent_configs)
+
+# Agent queries currently running, keyed by (agent_type, query, task_id), so that
+# identical concurrent requests from the same user share a single agent run
+_inflight: Dict[Tuple[str, str, str], "asyncio.Future[AgentQueryResponse]"] = {}
+
+# Headers sent with every server-sent events stream
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+}
+
 
 # Request/Response Models
 class AgentQueryRequest(BaseModel):
@@ -25,6 +57,30 @@ class AgentQueryRequest(BaseModel):
     )
 
 
+async def parse_agent_query(request: Request) -> AgentQueryRequest:
+    """Validate the raw JSON body in a single pydantic-core pass"""
+    try:
+        return AgentQueryRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ]
+        )
+
+
+# The body is parsed by parse_agent_query, so document it explicitly
+_AGENT_QUERY_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": AgentQueryRequest.model_json_schema()}
+        },
+    }
+}
+
+
 class AgentQueryResponse(BaseModel):
     response_type: str
     is_task_complete: bool
@@ -32,6 +88,13 @@ class AgentQueryResponse(BaseModel):
     content: Any
 
 
+# Handlers build AgentQueryResponse themselves, so document it without
+# response_model (which would validate the returned model a second time)
+_AGENT_QUERY_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    200: {"model": AgentQueryResponse}
+}
+
+
 class AgentStatusResponse(BaseModel):
     agent_name: str
     agent_type: str
@@ -41,34 +104,113 @@ class AgentStatusResponse(BaseModel):
     is_active: bool
 
 
+def _get_agents_status_body() -> bytes:
+    """Get the serialized agents status, refreshing it at most once per TTL"""
+    global _status_cache
+
+    cache = _status_cache
+    if cache and time.monotonic() - cache[0] < _STATUS_CACHE_TTL_SECONDS:
+        return cache[1]
+
+    # The refresh never yields to the event loop, so concurrent requests cannot race it
+    body = orjson.dumps(
+        [
+            {field: status[field] for field in _STATUS_FIELDS}
+            for status in agent_service.get_all_agents_status()
+        ]
+    )
+    _status_cache = (time.monotonic(), body)
+    return body
+
+
+async def _run_query(
+    agent_type: str, query: str, context_id: str, task_id: str
+) -> AgentQueryResponse:
+    """Run an agent query to completion, sharing the run with identical in-flight queries"""
+    if agent_type not in _VALID_AGENTS:
+        raise HTTPException(status_code=400, detail=f"Unknown agent_type: {agent_type}")
+
+    key = (agent_type, query, task_id)
+    inflight = _inflight.get(key)
+    if inflight is not None:
+        try:
+            # Shield so a disconnecting follower doesn't cancel the shared run
+            return await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            if not inflight.cancelled():
+                raise
+            # The original request was cancelled; run the query ourselves
+
+    future: asyncio.Future[AgentQueryResponse] = (
+        asyncio.get_running_loop().create_future()
+    )
+    _inflight[key] = future
+    try:
+        response = await _collect_query(agent_type, query, context_id, task_id)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark the exception as retrieved in case no follower is waiting
+        future.exception()
+        raise
+    else:
+        future.set_result(response)
+        return response
+    finally:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+async def _collect_query(
+    agent_type: str, query: str, context_id: str, task_id: str
+) -> AgentQueryResponse:
+    """Run an agent query to completion and return its final response"""
+    # Execute the query, keeping the last streamed chunk (typically the final result)
+    final_response = None
+    async for chunk in agent_service.query_agent(agent_type, query, context_id, task_id):
+        final_response = chunk
+
+    if final_response is None:
+        return AgentQueryResponse(
+            response_type="text",
+            is_task_complete=True,
+            require_user_input=False,
+            content="No response from agent",
+        )
+
+    return AgentQueryResponse(
+        response_type=final_response.get("response_type", "text"),
+        is_task_complete=final_response.get("is_task_complete", True),
+        require_user_input=final_response.get("require_user_input", False),
+        content=final_response.get("content", ""),
+    )
+
+
 # Endpoints
 @router.get("/agents/status", response_model=List[AgentStatusResponse])
 async def get_agents_status(
     current_user: User = Depends(get_current_user),
-) -> List[AgentStatusResponse]:
+) -> Response:
     """Get status of all available agents"""
     try:
-        agents_status_list = await agent_service.get_all_agents_status()
-
-        return [
-            AgentStatusResponse(
-                agent_name=status["agent_name"],
-                agent_type=status["agent_type"],
-                status=status["status"],
-                description=status["description"],
-                capabilities=status["capabilities"],
-                is_active=status["is_active"],
-            )
-            for status in agents_status_list
-        ]
+        return Response(
+            content=_get_agents_status_body(), media_type="application/json"
+        )
     except Exception as e:
         logger.error(f"Error getting agents status: {e}")
         raise HTTPException(status_code=500, detail="Failed to get agents status")
 
 
-@router.post("/agents/query", response_model=AgentQueryResponse)
+@router.post(
+    "/agents/query",
+    response_model=None,
+    responses=_AGENT_QUERY_RESPONSES,
+    openapi_extra=_AGENT_QUERY_OPENAPI,
+)
 async def query_agent(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ) -> AgentQueryResponse:
     """Query an agent with a specific request"""
@@ -79,30 +221,12 @@ async def query_agent(
         # Generate a task ID for this query
         task_id = f"task_{current_user.id}_{request.context_id}"
 
-        # Execute the query (collect all streaming responses)
-        responses = []
-        async for chunk in agent_service.query_agent(
+        return await _run_query(
             request.agent_type, request.query, request.context_id, task_id
-        ):
-            responses.append(chunk)
-
-        # Return the last response (typically the final result)
-        if responses:
-            final_response = responses[-1]
-            return AgentQueryResponse(
-                response_type=final_response.get("response_type", "text"),
-                is_task_complete=final_response.get("is_task_complete", True),
-                require_user_input=final_response.get("require_user_input", False),
-                content=final_response.get("content", ""),
-            )
-        else:
-            return AgentQueryResponse(
-                response_type="text",
-                is_task_complete=True,
-                require_user_input=False,
-                content="No response from agent",
-            )
+        )
 
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"Invalid request: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -111,15 +235,19 @@ async def query_agent(
         raise HTTPException(status_code=500, detail=f"Failed to query agent: {str(e)}")
 
 
-@router.post("/agents/query/stream")
+@router.post("/agents/query/stream", openapi_extra=_AGENT_QUERY_OPENAPI)
 async def query_agent_stream(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ):
     """Stream agent responses in real-time"""
     try:
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query cannot be empty")
+        if request.agent_type not in _VALID_AGENTS:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown agent_type: {request.agent_type}"
+            )
 
         # Generate a task ID for this query
         task_id = f"task_{current_user.id}_{request.context_id}"
@@ -138,14 +266,11 @@ async def query_agent_stream(
         return StreamingResponse(
             generate_stream(),
             media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "*",
-            },
+            headers=_SSE_HEADERS,
         )
 
+    except HTTPException:
+        raise
     except ValueError as e:
         logger.error(f"Invalid request: {e}")
         raise HTTPException(status_code=400, detail=str(e))
@@ -154,9 +279,14 @@ async def query_agent_stream(
         raise HTTPException(status_code=500, detail=f"Failed to setup stream: {str(e)}")
 
 
-@router.post("/agents/code-search")
+@router.post(
+    "/agents/code-search",
+    response_model=None,
+    responses=_AGENT_QUERY_RESPONSES,
+    openapi_extra=_AGENT_QUERY_OPENAPI,
+)
 async def perform_code_search(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ) -> AgentQueryResponse:
     """Perform comprehensive code search using the orchestrator agent"""
@@ -198,14 +328,17 @@ async def perform_code_search(
         )
 
 
-@router.get("/agents/code-search/summary/{context_id}")
+@router.get(
+    "/agents/code-search/summary/{context_id}", response_model=Dict[str, Any]
+)
 async def get_code_search_summary(
     context_id: str,
     current_user: User = Depends(get_current_user),
-) -> Dict[str, Any]:
+) -> Response:
     """Get a summary of code search results for a specific context"""
     try:
-        return await agent_service.generate_code_search_summary(context_id)
+        summary = await agent_service.generate_code_search_summary(context_id)
+        return Response(content=orjson.dumps(summary), media_type="application/json")
 
     except ValueError as e:
         logger.error(f"Invalid request: {e}")
@@ -217,14 +350,15 @@ async def get_code_search_summary(
         )
 
 
-@router.delete("/agents/context/{context_id}")
+@router.delete("/agents/context/{context_id}", response_model=Dict[str, str])
 async def clear_agent_context(
     context_id: str,
     current_user: User = Depends(get_current_user),
-) -> Dict[str, str]:
+) -> Response:
     """Clear the context/state for a specific session"""
     try:
-        return await agent_service.clear_agent_context(context_id)
+        result = await agent_service.clear_agent_context(context_id)
+        return Response(content=orjson.dumps(result), media_type="application/json")
 
     except Exception as e:
         logger.error(f"Error clearing context: {e}")
@@ -234,9 +368,14 @@ async def clear_agent_context(
 
 
 # Specialized endpoints for each agent type
-@router.post("/agents/semantic-search")
+@router.post(
+    "/agents/semantic-search",
+    response_model=None,
+    responses=_AGENT_QUERY_RESPONSES,
+    openapi_extra=_AGENT_QUERY_OPENAPI,
+)
 async def perform_semantic_search(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ) -> AgentQueryResponse:
     """Perform semantic code search using the Code Search Agent"""
@@ -245,6 +384,8 @@ async def perform_semantic_search(
         request.agent_type = "code_search"
         return await query_agent(request, current_user)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error performing semantic search: {e}")
         raise HTTPException(
@@ -252,9 +393,14 @@ async def perform_semantic_search(
         )
 
 
-@router.post("/agents/code-analysis")
+@router.post(
+    "/agents/code-analysis",
+    response_model=None,
+    responses=_AGENT_QUERY_RESPONSES,
+    openapi_extra=_AGENT_QUERY_OPENAPI,
+)
 async def perform_code_analysis(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ) -> AgentQueryResponse:
     """Perform code analysis using the Code Analysis Agent"""
@@ -263,6 +409,8 @@ async def perform_code_analysis(
         request.agent_type = "code_analysis"
         return await query_agent(request, current_user)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error performing code analysis: {e}")
         raise HTTPException(
@@ -270,9 +418,14 @@ async def perform_code_analysis(
         )
 
 
-@router.post("/agents/documentation")
+@router.post(
+    "/agents/documentation",
+    response_model=None,
+    responses=_AGENT_QUERY_RESPONSES,
+    openapi_extra=_AGENT_QUERY_OPENAPI,
+)
 async def generate_documentation(
-    request: AgentQueryRequest,
+    request: AgentQueryRequest = Depends(parse_agent_query),
     current_user: User = Depends(get_current_user),
 ) -> AgentQueryResponse:
     """Generate documentation using the Code Documentation Agent"""
@@ -281,6 +434,8 @@ async def generate_documentation(
         request.agent_type = "code_documentation"
         return await query_agent(request, current_user)
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating documentation: {e}")
         raise HTTPException(
@@ -2,13 +2,16 @@ import uuid
 from typing import Any, List, Optional
 from datetime import datetime, timezone
 import asyncio
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from sqlmodel import func, select, col
-from urllib.parse import urlparse
+import threading
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException, Response
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, func, select, update, col
 import re
 
 from app.api.deps import CurrentUser, SessionDep
 from app.models import (
+    CodeSearchEmbedding,
     CodeSearchSession,
     CodeSearchSessionCreate,
     CodeSearchSessionUpdate,
@@ -16,46 +19,74 @@ from app.models import (
     CodeSearchSessionsPublic,
     Message,
 )
-from app.services.embedding_service import EmbeddingService
+from app.services.embedding_worker import embedding_worker
 
 router = APIRouter(prefix="/code-search", tags=["code-search"])
 
-# Initialize embedding service
-embedding_service = EmbeddingService()
+_UTC = timezone.utc
 
-def extract_repo_name_from_url(url: str) -> str:
-    """Extract repository name from GitHub URL"""
-    try:
-        # Remove trailing slash and fragments
-        clean_url = url.rstrip("/").split("#")[0].split("?")[0]
-        
-        # Handle different GitHub URL formats
-        patterns = [
-            r"github\.com/([^/]+/[^/]+)/?$",  # https://github.com/owner/repo
-            r"github\.com/([^/]+/[^/]+)/tree/.*$",  # https://github.com/owner/repo/tree/branch
-            r"github\.com/([^/]+/[^/]+)/.*$",  # https://github.com/owner/repo/anything
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, clean_url)
-            if match:
-                return match.group(1)
-        
-        raise ValueError("Could not extract repository name")
-    except Exception as e:
-        raise ValueError(f"Invalid GitHub URL: {e}")
+# Matches owner/repo in any GitHub URL format
+# (https://github.com/owner/repo, .../tree/branch, .../anything)
+_GH_RE = re.compile(r"github\.com/([^/#?]+/[^/#?]+)")
+_GH_PREFIXES = ("https://github.com/", "http://github.com/")
 
-def is_valid_github_url(url: str) -> bool:
-    """Validate GitHub URL format"""
-    try:
-        parsed = urlparse(url)
-        return (
-            parsed.scheme in ("http", "https") and
-            parsed.netloc == "github.com" and
-            bool(extract_repo_name_from_url(url))
-        )
-    except:
-        return False
+# Serialized CodeSearchSessionPublic JSON, keyed by the fields every write touches
+_SESSION_JSON_CACHE_SIZE = 1024
+_session_json_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_session_json_lock = threading.Lock()
+
+_REPO_UNIQUE_CONSTRAINT = "uq_codesearchsession_owner_id_github_url"
+
+def parse_github_url(url: str) -> Optional[str]:
+    """Validate a GitHub URL and return its repository name (owner/repo), or None if invalid"""
+    # The prefix check pins both scheme and host, so no general URL parsing is needed
+    if not url.startswith(_GH_PREFIXES):
+        return None
+    
+    # Every prefix ends in "github.com/"; match from there so a bare host
+    # such as "https://github.com/?tab=x" is rejected rather than raising
+    start = url.index("github.com/")
+    
+    # Remove fragments, query string and trailing slash
+    clean_url = url.partition("#")[0].partition("?")[0].rstrip("/")
+    
+    match = _GH_RE.match(clean_url, start)
+    return match.group(1) if match else None
+
+def _session_json(db_session: CodeSearchSession) -> bytes:
+    """Serialize a session for the API, reusing the cached JSON while the row is unchanged"""
+    key = (
+        db_session.id,
+        db_session.updated_at,
+        db_session.last_used,
+        db_session.vector_embeddings_processed,
+    )
+    with _session_json_lock:
+        body = _session_json_cache.get(key)
+        if body is not None:
+            _session_json_cache.move_to_end(key)
+            return body
+    
+    body = CodeSearchSessionPublic.model_validate(db_session).model_dump_json().encode()
+    with _session_json_lock:
+        _session_json_cache[key] = body
+        if len(_session_json_cache) > _SESSION_JSON_CACHE_SIZE:
+            _session_json_cache.popitem(last=False)
+    return body
+
+def _is_repository_conflict(error: IntegrityError) -> bool:
+    """Whether an IntegrityError is the one-session-per-repository unique violation"""
+    diag = getattr(error.orig, "diag", None)
+    return getattr(diag, "constraint_name", None) == _REPO_UNIQUE_CONSTRAINT
+
+def _load_owned_session(
+    session: Session, session_id: uuid.UUID, user_id: uuid.UUID
+) -> CodeSearchSession:
+    """Load a session by primary key, raising 404 if missing or owned by another user"""
+    db_session = session.get(CodeSearchSession, session_id)
+    if db_session is None or db_session.owner_id != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return db_session
 
 @router.get("/sessions", response_model=CodeSearchSessionsPublic)
 def get_user_sessions(
@@ -66,23 +97,30 @@ def get_user_sessions(
 ) -> Any:
     """Get all code search sessions for the current user"""
     
-    # Count total sessions
-    count_statement = (
-        select(func.count())
-        .select_from(CodeSearchSession)
-        .where(CodeSearchSession.owner_id == current_user.id)
-    )
-    count = session.exec(count_statement).one()
-    
-    # Get sessions ordered by last_used (most recent first)
+    # Get sessions ordered by last_used (most recent first), with the total
+    # count computed by a window function in the same query
     statement = (
-        select(CodeSearchSession)
+        select(CodeSearchSession, func.count().over().label("total"))
         .where(CodeSearchSession.owner_id == current_user.id)
         .order_by(CodeSearchSession.last_used.desc())
         .offset(skip)
         .limit(limit)
     )
-    sessions = session.exec(statement).all()
+    rows = session.exec(statement).all()
+    sessions = [row[0] for row in rows]
+    
+    if rows:
+        count = rows[0].total
+    elif skip > 0:
+        # Page is past the end, so the window count is unavailable
+        count_statement = (
+            select(func.count())
+            .select_from(CodeSearchSession)
+            .where(CodeSearchSession.owner_id == current_user.id)
+        )
+        count = session.exec(count_statement).one()
+    else:
+        count = 0
     
     return CodeSearchSessionsPublic(data=sessions, count=count)
 
@@ -91,40 +129,18 @@ def create_session(
     *,
     session: SessionDep,
     current_user: CurrentUser,
-    background_tasks: BackgroundTasks,
     session_in: CodeSearchSessionCreate
 ) -> Any:
     """Create a new code search session"""
     
     # Validate GitHub URL if provided
     if session_in.github_url:
-        if not is_valid_github_url(session_in.github_url):
+        repo_name = parse_github_url(session_in.github_url)
+        if repo_name is None:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid GitHub URL. Please provide a valid GitHub repository URL."
             )
-        
-        # Extract repository name for uniqueness check
-        try:
-            repo_name = extract_repo_name_from_url(session_in.github_url)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-        
-        # Check if user already has a session for this repository
-        existing_session = session.exec(
-            select(CodeSearchSession).where(
-                CodeSearchSession.owner_id == current_user.id,
-                CodeSearchSession.github_url == session_in.github_url
-            )
-        ).first()
-        
-        if existing_session:
-            # Update last_used and return existing session
-            existing_session.last_used = datetime.now(timezone.utc)
-            session.add(existing_session)
-            session.commit()
-            session.refresh(existing_session)
-            return existing_session
     
     # Create new session
     db_session = CodeSearchSession.model_validate(
@@ -133,16 +149,31 @@ def create_session(
     )
     
     session.add(db_session)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        if not _is_repository_conflict(e):
+            raise
+        # User already has a session for this repository (unique owner_id, github_url)
+        existing_session = session.exec(
+            select(CodeSearchSession).where(
+                CodeSearchSession.owner_id == current_user.id,
+                CodeSearchSession.github_url == session_in.github_url
+            )
+        ).one()
+        
+        # Update last_used and return existing session
+        existing_session.last_used = datetime.now(_UTC)
+        session.add(existing_session)
+        session.commit()
+        session.refresh(existing_session)
+        return existing_session
     session.refresh(db_session)
     
-    # Start background embedding generation if GitHub URL provided
+    # Queue embedding generation if GitHub URL provided
     if session_in.github_url:
-        background_tasks.add_task(
-            embedding_service.generate_embeddings_for_session,
-            db_session.id,
-            session_in.github_url
-        )
+        embedding_worker.enqueue(db_session.id, session_in.github_url)
     
     return db_session
 
@@ -154,17 +185,10 @@ def get_session(
 ) -> Any:
     """Get a specific code search session"""
     
-    db_session = session.exec(
-        select(CodeSearchSession).where(
-            CodeSearchSession.id == session_id,
-            CodeSearchSession.owner_id == current_user.id
-        )
-    ).first()
-    
-    if not db_session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    db_session = _load_owned_session(session, session_id, current_user.id)
     
-    return db_session
+    # Polled by the frontend, so skip re-validating unchanged rows
+    return Response(content=_session_json(db_session), media_type="application/json")
 
 @router.put("/sessions/{session_id}", response_model=CodeSearchSessionPublic)
 def update_session(
@@ -175,25 +199,26 @@ def update_session(
 ) -> Any:
     """Update a code search session"""
     
-    db_session = session.exec(
-        select(CodeSearchSession).where(
-            CodeSearchSession.id == session_id,
-            CodeSearchSession.owner_id == current_user.id
-        )
-    ).first()
-    
-    if not db_session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    db_session = _load_owned_session(session, session_id, current_user.id)
     
     # Update fields
     session_data = session_update.model_dump(exclude_unset=True)
-    session_data["updated_at"] = datetime.now(timezone.utc)
+    session_data["updated_at"] = datetime.now(_UTC)
     
     for field, value in session_data.items():
         setattr(db_session, field, value)
     
     session.add(db_session)
-    session.commit()
+    try:
+        session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        if not _is_repository_conflict(e):
+            raise
+        raise HTTPException(
+            status_code=400,
+            detail="A session for this GitHub repository already exists"
+        )
     session.refresh(db_session)
     
     return db_session
@@ -206,15 +231,7 @@ def delete_session(
 ) -> Message:
     """Delete a code search session"""
     
-    db_session = session.exec(
-        select(CodeSearchSession).where(
-            CodeSearchSession.id == session_id,
-            CodeSearchSession.owner_id == current_user.id
-        )
-    ).first()
-    
-    if not db_session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    db_session = _load_owned_session(session, session_id, current_user.id)
     
     session.delete(db_session)
     session.commit()
@@ -229,18 +246,14 @@ def get_embeddings_status(
 ) -> Any:
     """Get the embeddings processing status for a session"""
     
-    db_session = session.exec(
-        select(CodeSearchSession).where(
-            CodeSearchSession.id == session_id,
-            CodeSearchSession.owner_id == current_user.id
-        )
-    ).first()
-    
-    if not db_session:
-        raise HTTPException(status_code=404, detail="Session not found")
+    db_session = _load_owned_session(session, session_id, current_user.id)
     
-    # Get embeddings count
-    embeddings_count = len(db_session.embeddings) if db_session.embeddings else 0
+    # Count embeddings in the database instead of loading every row
+    embeddings_count = session.exec(
+        select(func.count())
+        .select_from(CodeSearchEmbedding)
+        .where(CodeSearchEmbedding.session_id == session_id)
+    ).one()
     
     return {
         "session_id": session_id,
@@ -254,38 +267,38 @@ def get_embeddings_status(
 def regenerate_embeddings(
     session_id: uuid.UUID,
     session: SessionDep,
-    current_user: CurrentUser,
-    background_tasks: BackgroundTasks
+    current_user: CurrentUser
 ) -> Message:
     """Regenerate embeddings for a session"""
     
-    db_session = session.exec(
-        select(CodeSearchSession).where(
+    # Reset embeddings status and read the URL in a single statement
+    row = session.exec(
+        update(CodeSearchSession)
+        .where(
             CodeSearchSession.id == session_id,
             CodeSearchSession.owner_id == current_user.id
         )
+        .values(
+            vector_embeddings_processed=False,
+            updated_at=datetime.now(_UTC)
+        )
+        .returning(CodeSearchSession.github_url)
     ).first()
     
-    if not db_session:
+    if row is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    if not db_session.github_url:
+    github_url = row[0]
+    if not github_url:
+        session.rollback()
         raise HTTPException(
             status_code=400,
             detail="Cannot regenerate embeddings for sessions without a GitHub URL"
         )
     
-    # Reset embeddings status
-    db_session.vector_embeddings_processed = False
-    db_session.updated_at = datetime.now(timezone.utc)
-    session.add(db_session)
     session.commit()
     
-    # Start background embedding generation
-    background_tasks.add_task(
-        embedding_service.generate_embeddings_for_session,
-        session_id,
-        db_session.github_url
-    )
+    # Queue embedding generation
+    embedding_worker.enqueue(session_id, github_url)
     
     return Message(message="Embeddings regeneration started") 
@@ -98,6 +98,8 @@ class Settings(BaseSettings):
     
     # Google API Key for AI services
     GOOGLE_API_KEY: str
+    # Embedding API requests per minute allowed by the Google quota
+    EMBED_RPM: int = 1500
 
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
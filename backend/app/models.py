@@ -3,9 +3,10 @@ from datetime import datetime, timezone
 from typing import Optional, List
 
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel, Column
-from sqlalchemy import Text
-from pgvector.sqlalchemy import Vector
+from sqlmodel import AutoString, Field, Relationship, SQLModel, Column
+from sqlalchemy import Index, Text, UniqueConstraint, text
+from sqlalchemy.orm import deferred
+from pgvector.sqlalchemy import HALFVEC
 
 
 # Shared properties
@@ -124,6 +125,13 @@ class CodeSearchSessionUpdate(SQLModel):
 
 # Database model for code search sessions
 class CodeSearchSession(CodeSearchSessionBase, table=True):
+    __table_args__ = (
+        # Listing a user's sessions, most recently used first
+        Index("ix_codesearchsession_owner_id_last_used", "owner_id", text("last_used DESC")),
+        # One session per repository per user
+        UniqueConstraint("owner_id", "github_url", name="uq_codesearchsession_owner_id_github_url"),
+    )
+    
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     owner_id: uuid.UUID = Field(
         foreign_key="user.id", nullable=False, ondelete="CASCADE"
@@ -172,17 +180,34 @@ class CodeSearchEmbeddingUpdate(SQLModel):
     file_metadata: Optional[str] = Field(default=None, max_length=5000)
 
 
+# Chunk text is only needed when a result is shown, so it is deferred: ORM loads
+# of embeddings skip it until the attribute is accessed (or undefer() is used).
+# Today the only such load is the cascade when a session or its owner is deleted;
+# every reader of the text queries it with raw SQL (see the MCP db_connection),
+# so this mainly keeps future ORM reads from fetching it by default.
+_embedding_file_content_column = Column("file_content", AutoString(100000), nullable=False)
+
+
 # Database model for code search embeddings
 class CodeSearchEmbedding(CodeSearchEmbeddingBase, table=True):
+    __mapper_args__ = {
+        "properties": {"file_content": deferred(_embedding_file_content_column)}
+    }
+    
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    file_content: str = Field(sa_column=_embedding_file_content_column)
     session_id: uuid.UUID = Field(
         foreign_key="codesearchsession.id", nullable=False, ondelete="CASCADE"
     )
-    # Override the embedding_vector field to use pgvector's VECTOR type
+    # Override the embedding_vector field to use pgvector's HALFVEC (fp16) type,
+    # half the storage of VECTOR with no practical loss in cosine recall
     embedding_vector: Optional[List[float]] = Field(
         default=None, 
-        sa_column=Column(Vector(768))  # 768 dimensions for Google Generative AI embeddings
+        sa_column=Column(HALFVEC(768))  # 768 dimensions for Google Generative AI embeddings
     )
+    # blake2b hex digest of the embedding model and chunk text, so identical
+    # chunks reuse a stored vector
+    content_hash: Optional[str] = Field(default=None, max_length=32, index=True)
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     session: CodeSearchSession | None = Relationship(back_populates="embeddings")
 
@@ -6,8 +6,9 @@ Manages A2A MCP agents and provides a clean interface for API routes
 import logging
 import weave
 from typing import Any, Dict, List, Optional, AsyncIterator
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager, suppress
 import asyncio
+import functools
 from dataclasses import dataclass
 
 from app.a2a_mcp.src.a2a_mcp.agents.orchestrator_agent import OrchestratorAgent
@@ -15,6 +16,9 @@ from app.a2a_mcp.src.a2a_mcp.agents.adk_travel_agent import CodeSearchAgent
 
 logger = logging.getLogger(__name__)
 
+# Marks the end of a pipelined agent stream
+_STREAM_END = object()
+
 @dataclass
 class AgentConfig:
     """Configuration for an agent"""
@@ -35,6 +39,10 @@ class AgentService:
         self.code_search_agents: Dict[str, CodeSearchAgent] = {}
         self.agent_configs: Dict[str, AgentConfig] = {}
         self._initialize_configs()
+        
+        # Guard lazy agent construction so concurrent first requests build one agent
+        self._orchestrator_lock = asyncio.Lock()
+        self._agent_locks: Dict[str, asyncio.Lock] = {}
     
     def _initialize_configs(self):
         """Initialize agent configurations"""
@@ -69,12 +77,35 @@ class AgentService:
                 capabilities=["documentation_generation", "docstring_creation", "code_comments"]
             )
         }
+        
+        # Static part of each agent's status response; only the active flag changes
+        self._status_templates = {
+            agent_type: {
+                "agent_name": config.agent_name,
+                "agent_type": config.agent_type,
+                "description": config.description,
+                "capabilities": config.capabilities,
+            }
+            for agent_type, config in self.agent_configs.items()
+        }
+        
+        # Agent getter per type, so lookups by type are a single dict access
+        self._getters = {
+            "orchestrator": self.get_orchestrator_agent,
+            **{
+                agent_type: functools.partial(self.get_code_search_agent, agent_type)
+                for agent_type in self.agent_configs
+                if agent_type != "orchestrator"
+            }
+        }
     
     async def get_orchestrator_agent(self) -> OrchestratorAgent:
         """Get or create the orchestrator agent"""
         if self.orchestrator_agent is None:
-            logger.info("Initializing orchestrator agent")
-            self.orchestrator_agent = OrchestratorAgent()
+            async with self._orchestrator_lock:
+                if self.orchestrator_agent is None:
+                    logger.info("Initializing orchestrator agent")
+                    self.orchestrator_agent = OrchestratorAgent()
         return self.orchestrator_agent
     
     async def get_code_search_agent(self, agent_type: str) -> CodeSearchAgent:
@@ -83,25 +114,59 @@ class AgentService:
             if agent_type not in self.agent_configs:
                 raise ValueError(f"Unknown agent type: {agent_type}")
             
-            config = self.agent_configs[agent_type]
-            logger.info(f"Initializing code search agent: {agent_type}")
-            
-            self.code_search_agents[agent_type] = CodeSearchAgent(
-                agent_name=config.agent_name,
-                description=config.description,
-                instructions=config.instructions
-            )
+            async with self._agent_locks.setdefault(agent_type, asyncio.Lock()):
+                if agent_type not in self.code_search_agents:
+                    config = self.agent_configs[agent_type]
+                    logger.info(f"Initializing code search agent: {agent_type}")
+                    
+                    self.code_search_agents[agent_type] = CodeSearchAgent(
+                        agent_name=config.agent_name,
+                        description=config.description,
+                        instructions=config.instructions
+                    )
         
         return self.code_search_agents[agent_type]
     
     async def get_agent_by_type(self, agent_type: str):
         """Get an agent by type (orchestrator or code search agent)"""
-        if agent_type == "orchestrator":
-            return await self.get_orchestrator_agent()
-        elif agent_type in self.agent_configs and agent_type != "orchestrator":
-            return await self.get_code_search_agent(agent_type)
-        else:
+        getter = self._getters.get(agent_type)
+        if getter is None:
             raise ValueError(f"Unknown agent type: {agent_type}")
+        return await getter()
+    
+    async def _pipeline(
+        self, stream: AsyncIterator[Dict[str, Any]], maxsize: int = 8
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Run an agent stream in its own task, buffering up to `maxsize` chunks,
+        so the agent keeps producing while earlier chunks are sent to the client
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        
+        async def produce():
+            try:
+                # Close the agent stream here, not at garbage collection, even
+                # when the consumer goes away and this task is cancelled
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        await queue.put(chunk)
+            except Exception as e:
+                await queue.put(e)
+            await queue.put(_STREAM_END)
+        
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()
+            with suppress(asyncio.CancelledError):
+                await producer
     
     async def query_agent(
         self, 
@@ -115,7 +180,7 @@ class AgentService:
             agent = await self.get_agent_by_type(agent_type)
             
             # Stream responses from the agent
-            async for chunk in agent.stream(query, context_id, task_id):
+            async for chunk in self._pipeline(agent.stream(query, context_id, task_id)):
                 yield chunk
                 
         except Exception as e:
@@ -127,38 +192,31 @@ class AgentService:
                 "content": f"Error: {str(e)}"
             }
     
-    async def get_agent_status(self, agent_type: str) -> Dict[str, Any]:
-        """Get the status of a specific agent"""
-        if agent_type not in self.agent_configs:
-            raise ValueError(f"Unknown agent type: {agent_type}")
-        
-        config = self.agent_configs[agent_type]
-        
-        # Check if agent is initialized
-        is_active = False
+    def _is_agent_active(self, agent_type: str) -> bool:
+        """Check whether the agent for a type has been initialized"""
         if agent_type == "orchestrator":
-            is_active = self.orchestrator_agent is not None
-        else:
-            is_active = agent_type in self.code_search_agents
-        
+            return self.orchestrator_agent is not None
+        return agent_type in self.code_search_agents
+    
+    def _build_status(self, agent_type: str) -> Dict[str, Any]:
+        """Merge an agent's precomputed status template with its current active flag"""
+        is_active = self._is_agent_active(agent_type)
         return {
-            "agent_name": config.agent_name,
-            "agent_type": config.agent_type,
+            **self._status_templates[agent_type],
             "status": "active" if is_active else "inactive",
-            "description": config.description,
-            "capabilities": config.capabilities,
             "is_active": is_active
         }
     
-    async def get_all_agents_status(self) -> List[Dict[str, Any]]:
-        """Get status of all available agents"""
-        agents_status = []
-        
-        for agent_type in self.agent_configs:
-            status = await self.get_agent_status(agent_type)
-            agents_status.append(status)
+    async def get_agent_status(self, agent_type: str) -> Dict[str, Any]:
+        """Get the status of a specific agent"""
+        if agent_type not in self._status_templates:
+            raise ValueError(f"Unknown agent type: {agent_type}")
         
-        return agents_status
+        return self._build_status(agent_type)
+    
+    def get_all_agents_status(self) -> List[Dict[str, Any]]:
+        """Get status of all available agents"""
+        return [self._build_status(agent_type) for agent_type in self._status_templates]
     
     async def clear_agent_context(self, context_id: str) -> Dict[str, str]:
         """Clear the context/state for a specific session"""
@@ -216,7 +274,7 @@ class AgentService:
             orchestrator = await self.get_orchestrator_agent()
             
             # Use orchestrator to coordinate the code search
-            async for chunk in orchestrator.stream(query, context_id, task_id):
+            async for chunk in self._pipeline(orchestrator.stream(query, context_id, task_id)):
                 yield chunk
                 
         except Exception as e:
@@ -3,27 +3,106 @@ Embedding Service
 Handles generation of embeddings for code search using Google Generative AI
 """
 
+import atexit
 import os
 import tempfile
 import shutil
 import uuid
-from typing import List, Optional, Dict, Any
-from pathlib import Path
+from typing import List, Optional, Dict, Any, AsyncIterator, Callable, Iterable, Iterator, Tuple
+from collections import OrderedDict, deque
+from contextlib import aclosing, suppress
 import logging
 import asyncio
 from datetime import datetime, timezone
 import subprocess
 import mimetypes
-from sqlmodel import Session, select
-import google.generativeai as genai
+import functools
+import hashlib
+import itertools
+import json
+import re
+import zipfile
+import httpx
+import numpy as np
+from sqlmodel import Session, col, select
+from google import genai
+from google.genai import types as genai_types
+from tenacity import AsyncRetrying, RetryCallState, retry_if_exception, stop_after_attempt, wait_random_exponential
 import weave
 
 from app.core.db import engine
 from app.models import CodeSearchSession, CodeSearchEmbedding
 from app.core.config import settings
+from app.services.rate_limiter import AsyncRateLimiter
+from app.services.vector_store import MemmapVectorStore
 
 logger = logging.getLogger(__name__)
 
+# Pieces for approximate token counting: runs of ASCII word characters (about
+# 4 characters per token), or any other single non-space character (punctuation
+# and CJK characters are usually a token each)
+_TOKEN_PIECE_RE = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+# owner/repo of a github.com URL, for zipball downloads
+_GITHUB_REPO_RE = re.compile(r"^https?://github\.com/([^/#?]+)/([^/#?]+?)(?:\.git)?/?(?:[#?].*)?$")
+
+# Directories never worth indexing (hidden directories are skipped as well)
+_EXCLUDED_DIRS = frozenset({
+    'node_modules', '__pycache__', '.git', '.vscode', '.idea',
+    'build', 'dist', 'target', 'bin', 'obj', 'venv', 'env'
+})
+
+# Extensionless files known to be text, by lowercased name (skips the content probe)
+_TEXT_FILENAMES = frozenset({
+    'makefile', 'dockerfile', 'gemfile', 'rakefile', 'procfile', 'vagrantfile',
+    'jenkinsfile', 'brewfile', 'podfile', 'justfile', 'license', 'readme',
+    'changelog', 'authors', 'contributors', 'notice', 'copying'
+})
+
+
+def _is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an embedding API error is a rate limit / quota error worth retrying"""
+    if getattr(error, 'code', None) == 429 or getattr(error, 'status', None) == 'RESOURCE_EXHAUSTED':
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "quota" in message
+
+
+def _retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the Retry-After header of a failed API response, if any"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    try:
+        return float(headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _skip_dir(name: str) -> bool:
+    """Whether a directory should be left out of repository processing"""
+    return name[:1] == '.' or name in _EXCLUDED_DIRS
+
+
+@functools.lru_cache(maxsize=4096)
+def _classify_file_name(file_name: str) -> Optional[bool]:
+    """
+    Classify a file by name: True to process, False to skip, None if the
+    content must be sampled. Cached since names like __init__.py repeat often.
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext:
+        return ext in EmbeddingService.SUPPORTED_EXTENSIONS
+    if file_name.lower() in _TEXT_FILENAMES:
+        return True
+    return None
+
+
+class RepoTooLargeError(Exception):
+    """Raised while enumerating a repository once it exceeds MAX_REPO_SIZE_MB"""
+
+    def __init__(self, size_bytes: int):
+        super().__init__(f"Repository is too large ({size_bytes / (1024*1024):.2f} MB so far)")
+        self.size_bytes = size_bytes
+
 class EmbeddingService:
     """
     Service for generating embeddings from GitHub repositories using Google Generative AI.
@@ -31,7 +110,7 @@ class EmbeddingService:
     This service downloads GitHub repositories, processes code files, and generates
     vector embeddings for semantic code search. It includes:
     
-    - Repository download via git clone
+    - Repository download via GitHub zipball (git clone fallback)
     - File filtering and content processing
     - Text chunking for large files
     - Real embedding generation using Google's text-embedding-004 model
@@ -53,9 +132,31 @@ class EmbeddingService:
     MAX_FILES_TO_PROCESS = 1000  # Maximum number of files to process
     CHUNK_SIZE = 1000  # Size of each text chunk for embedding
     MAX_EMBEDDINGS_PER_SESSION = 2000  # Maximum embeddings per session
+    EMBEDDING_BATCH_SIZE = 100  # Chunks per embedding API call (API maximum is 100)
     
     # Embedding model configuration
     EMBEDDING_MODEL = "models/text-embedding-004"
+    EMBEDDING_DIMENSIONS = 768  # Output dimensionality requested from the model
+    MODEL_TOKEN_LIMIT = 2048  # Input tokens the embedding model reads per text
+    HTTP_MAX_CONNECTIONS = 32  # Pooled HTTPS connections to the embedding API
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = 16  # Idle connections kept open for reuse
+    
+    MAX_CONCURRENT_EMBEDDING_REQUESTS = 8  # In-flight embedding API calls per loop
+    EMBEDDING_MAX_ATTEMPTS = 6  # API attempts per batch when rate limited
+    EMBEDDING_RETRY_MULTIPLIER = 0.5  # Seconds; scales the jittered exponential backoff
+    EMBEDDING_RETRY_MAX_WAIT = 30  # Seconds; longest backoff between attempts
+    FILE_READ_PREFETCH = 16  # Files read ahead in worker threads while chunking
+    EMBEDDING_WORKERS = 8  # Pipeline tasks embedding chunk batches concurrently
+    PIPELINE_QUEUE_SIZE = 16  # Batches buffered between pipeline stages
+    EMBEDDING_CACHE_SIZE = 10000  # Embeddings kept in memory, keyed by content hash
+    # Reuse a cached embedding for near-duplicate text. Off by default: a reused
+    # vector is stored as the new chunk's embedding, so only enable it where an
+    # approximate vector is acceptable, such as repeated query-time lookups.
+    FUZZY_CACHE_ENABLED = False
+    FUZZY_CACHE_MAX_DISTANCE = 3  # Differing SimHash bits still counted as a near duplicate
+    FUZZY_CACHE_MIN_SIMILARITY = 0.9  # Minimum shingle Jaccard and token count ratio to confirm a match
+    FUZZY_CACHE_SIZE = 2000  # Cached texts whose fingerprints are kept for fuzzy lookups
+    SIMHASH_BANDS = 4  # 16-bit bands; any match within the distance shares one
     
     # Supported file extensions for code analysis
     SUPPORTED_EXTENSIONS = {
@@ -68,7 +169,38 @@ class EmbeddingService:
     }
     
     def __init__(self):
-        self.temp_dir = tempfile.mkdtemp(prefix="code_search_")
+        # Name the directory after the process so parallel test workers and
+        # app processes sharing /tmp are easy to tell apart
+        self.temp_dir = tempfile.mkdtemp(prefix=f"code_search_{os.getpid()}_")
+        # __del__ is not guaranteed to run, so also clean up at interpreter exit
+        atexit.register(shutil.rmtree, self.temp_dir, True)
+        
+        # Limits in-flight embedding API calls and paces them to the quota,
+        # created lazily on the loop that first uses them
+        self._request_semaphore: Optional[asyncio.Semaphore] = None
+        self._request_limiter: Optional[AsyncRateLimiter] = None
+        self._request_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # Embeddings by content hash, so duplicate chunks (license headers,
+        # generated files, empty __init__.py) are only sent to the API once.
+        # Stored as float16, the precision of the halfvec column, in a file
+        # mapped from temp_dir so repo-scale caches stay off the Python heap.
+        self._embedding_cache = MemmapVectorStore(
+            os.path.join(self.temp_dir, "embedding_cache.f16"),
+            self.EMBEDDING_DIMENSIONS,
+            self.EMBEDDING_CACHE_SIZE,
+        )
+        
+        # SimHash signatures of cached texts, indexed by (band, band bits), so
+        # a small edit (whitespace, a typo) can reuse the original's embedding.
+        # Fingerprints (signature, distinct shingle hashes, token count) confirm
+        # a candidate before its vector is reused.
+        self._simhash_index: Dict[Tuple[int, int], List[Tuple[int, str]]] = {}
+        self._fuzzy_fingerprints: "OrderedDict[str, Tuple[int, np.ndarray, int]]" = OrderedDict()
+        
+        # One client per service, so every embedding call reuses its pooled connections
+        self._client: Optional[genai.Client] = None
+        self._http_transport: Optional[httpx.AsyncHTTPTransport] = None
         
         # Configure Google Generative AI
         api_key = getattr(settings, 'GOOGLE_API_KEY', None) or os.getenv('GOOGLE_API_KEY')
@@ -77,7 +209,8 @@ class EmbeddingService:
             self.genai_available = False
         else:
             try:
-                genai.configure(api_key=api_key)
+                self._client = self._create_client(api_key)
+                self._api_key = api_key
                 self.genai_available = True
                 logger.info("Google GenAI configured for embeddings successfully")
             except Exception as e:
@@ -85,11 +218,66 @@ class EmbeddingService:
                 self.genai_available = False
                 raise ValueError(f"Failed to configure Google GenAI with provided API key: {e}") from e
         
+    def _create_client(self, api_key: str) -> genai.Client:
+        """Create a GenAI client whose async calls share one pooled httpx transport"""
+        # Passing a transport also keeps the SDK from opening a new aiohttp
+        # session, and so a new TLS connection, for every request
+        self._http_transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=self.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=self.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            )
+        )
+        return genai.Client(
+            api_key=api_key,
+            http_options=genai_types.HttpOptions(
+                async_client_args={"transport": self._http_transport}
+            ),
+        )
+    
+    async def aclose(self):
+        """Close pooled connections to the embedding API and remove the temp directory"""
+        if self._http_transport is not None:
+            await self._http_transport.aclose()
+        self.cleanup()
+    
+    @staticmethod
+    async def _close_transport(
+        transport: httpx.AsyncHTTPTransport, loop: asyncio.AbstractEventLoop
+    ) -> None:
+        """Close a transport replaced after a loop change, on the loop that opened its connections"""
+        try:
+            if loop.is_running():
+                # The old loop still runs in another thread
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(transport.aclose(), loop))
+            else:
+                await transport.aclose()
+        except RuntimeError as e:
+            # Connections opened on a loop that has since closed cannot be shut
+            # down cleanly; they are dropped with the transport
+            logger.debug(f"Could not close embedding API connections from a closed event loop: {e}")
+    
+    def cleanup(self):
+        """Remove the temp directory and any repositories downloaded into it"""
+        if hasattr(self, 'temp_dir'):
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def __enter__(self) -> "EmbeddingService":
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self.cleanup()
+    
+    async def __aenter__(self) -> "EmbeddingService":
+        return self
+    
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+    
     def __del__(self):
-        """Clean up temp directory"""
+        """Fallback cleanup for services not closed with aclose() or a with block"""
         try:
-            if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
+            self.cleanup()
         except:
             pass
     
@@ -101,63 +289,89 @@ class EmbeddingService:
         try:
             logger.info(f"Starting embedding generation for session {session_id}")
             
-            # Update session status
-            with Session(engine) as session:
-                db_session = session.get(CodeSearchSession, session_id)
-                if not db_session:
-                    logger.error(f"Session {session_id} not found")
-                    return
-                
-                db_session.vector_embeddings_processed = False
-                db_session.updated_at = datetime.now(timezone.utc)
-                session.add(db_session)
-                session.commit()
+            # Download repository, updating the session status while it runs
+            download = asyncio.create_task(self._download_repository(github_url))
+            try:
+                session_found = await asyncio.to_thread(
+                    self._set_embeddings_processed, session_id, False
+                )
+            except BaseException:
+                download.cancel()
+                raise
+            
+            if not session_found:
+                # Nothing to store embeddings for, so stop the download too
+                logger.error(f"Session {session_id} not found")
+                download.cancel()
+                with suppress(asyncio.CancelledError):
+                    await download
+                return
+            
+            repo_path = await download
             
-            # Download repository
-            repo_path = await self._download_repository(github_url)
             if not repo_path:
                 logger.error(f"Failed to download repository {github_url}")
                 return
             
             # Process files and generate embeddings
-            await self._process_repository(session_id, repo_path)
+            try:
+                await self._process_repository(session_id, repo_path)
+            except RepoTooLargeError as e:
+                logger.warning(f"Repository {github_url} is too large: {e}")
+                return
             
             # Mark session as processed
-            with Session(engine) as session:
-                db_session = session.get(CodeSearchSession, session_id)
-                if db_session:
-                    db_session.vector_embeddings_processed = True
-                    db_session.updated_at = datetime.now(timezone.utc)
-                    session.add(db_session)
-                    session.commit()
+            await asyncio.to_thread(self._set_embeddings_processed, session_id, True)
             
             logger.info(f"Completed embedding generation for session {session_id}")
             
         except Exception as e:
             logger.error(f"Error generating embeddings for session {session_id}: {e}")
             # Mark session as failed
-            with Session(engine) as session:
-                db_session = session.get(CodeSearchSession, session_id)
-                if db_session:
-                    db_session.vector_embeddings_processed = False
-                    db_session.updated_at = datetime.now(timezone.utc)
-                    session.add(db_session)
-                    session.commit()
+            await asyncio.to_thread(self._set_embeddings_processed, session_id, False)
         finally:
-            # Clean up downloaded repo
+            # Clean up downloaded repo in a thread; deleting thousands of files
+            # would otherwise stall every other job on the event loop
             if 'repo_path' in locals() and repo_path and os.path.exists(repo_path):
-                try:
-                    shutil.rmtree(repo_path)
-                except:
-                    pass
+                await asyncio.to_thread(shutil.rmtree, repo_path, ignore_errors=True)
+    
+    def _set_embeddings_processed(self, session_id: uuid.UUID, processed: bool) -> bool:
+        """Set a session's embeddings status (blocking); returns False if the session is gone"""
+        with Session(engine) as session:
+            db_session = session.get(CodeSearchSession, session_id)
+            if not db_session:
+                return False
+            
+            db_session.vector_embeddings_processed = processed
+            db_session.updated_at = datetime.now(timezone.utc)
+            session.add(db_session)
+            session.commit()
+            return True
     
     async def _download_repository(self, github_url: str) -> Optional[str]:
-        """Download repository using git clone"""
+        """Download repository as a zipball, falling back to git clone"""
+        repo_path = None
+        process = None
         try:
             # Create unique directory for this download
             repo_name = github_url.split('/')[-1].replace('.git', '')
             repo_path = os.path.join(self.temp_dir, f"{repo_name}_{uuid.uuid4().hex[:8]}")
             
+            match = _GITHUB_REPO_RE.match(github_url)
+            if match:
+                try:
+                    downloaded = await asyncio.wait_for(
+                        self._download_zipball(match.group(1), match.group(2), repo_path),
+                        timeout=300  # 5 minute timeout
+                    )
+                    if downloaded:
+                        logger.info(f"Downloaded repository {github_url} to {repo_path}")
+                        return repo_path
+                    return None
+                except Exception as e:
+                    logger.warning(f"Zipball download failed for {github_url}, falling back to git clone: {e}")
+                    await asyncio.to_thread(shutil.rmtree, repo_path, ignore_errors=True)
+            
             # Clone repository (shallow clone for speed)
             cmd = [
                 'git', 'clone', '--depth', '1', '--single-branch',
@@ -182,34 +396,71 @@ class EmbeddingService:
                 logger.error(f"Git clone failed for {github_url}: {stderr.decode()}")
                 return None
             
-            # Check repository size
-            repo_size = await self._get_directory_size(repo_path)
-            if repo_size > self.MAX_REPO_SIZE_MB * 1024 * 1024:
-                logger.warning(f"Repository {github_url} is too large ({repo_size / (1024*1024):.2f} MB)")
-                return None
-            
+            # Repository size is enforced while its files are enumerated
             logger.info(f"Downloaded repository {github_url} to {repo_path}")
             return repo_path
             
+        except asyncio.CancelledError:
+            # Leave nothing behind in temp_dir for a download nobody will use
+            if process is not None and process.returncode is None:
+                process.kill()
+            if repo_path:
+                await asyncio.to_thread(shutil.rmtree, repo_path, ignore_errors=True)
+            raise
         except Exception as e:
             logger.error(f"Error downloading repository {github_url}: {e}")
             return None
     
-    async def _get_directory_size(self, path: str) -> int:
-        """Get total size of directory in bytes"""
-        total_size = 0
+    async def _download_zipball(self, owner: str, repo: str, repo_path: str) -> bool:
+        """
+        Download the default branch of a GitHub repository as a zip archive and
+        extract it to repo_path. Returns False if the repository is too large.
+        """
+        max_bytes = self.MAX_REPO_SIZE_MB * 1024 * 1024
+        zip_url = f"https://codeload.github.com/{owner}/{repo}/zip/HEAD"
+        zip_path = f"{repo_path}.zip"
+        
         try:
-            for dirpath, dirnames, filenames in os.walk(path):
-                for filename in filenames:
-                    file_path = os.path.join(dirpath, filename)
-                    try:
-                        if os.path.isfile(file_path):
-                            total_size += os.path.getsize(file_path)
-                    except (OSError, IOError):
-                        continue
-        except Exception as e:
-            logger.error(f"Error calculating directory size: {e}")
-        return total_size
+            async with httpx.AsyncClient(follow_redirects=True, timeout=60) as client:
+                async with client.stream("GET", zip_url) as response:
+                    response.raise_for_status()
+                    downloaded = 0
+                    with open(zip_path, "wb") as f:
+                        async for data in response.aiter_bytes(1024 * 1024):
+                            downloaded += len(data)
+                            if downloaded > max_bytes:
+                                logger.warning(f"Repository {owner}/{repo} is too large (archive over {self.MAX_REPO_SIZE_MB} MB)")
+                                return False
+                            f.write(data)
+            
+            return await asyncio.to_thread(self._extract_zipball, zip_path, repo_path, max_bytes)
+        finally:
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+    
+    def _extract_zipball(self, zip_path: str, repo_path: str, max_bytes: int) -> bool:
+        """Extract a GitHub zipball, dropping its top-level "<repo>-<sha>/" directory"""
+        with zipfile.ZipFile(zip_path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            
+            # Check uncompressed size before writing anything
+            total_size = sum(info.file_size for info in members)
+            if total_size > max_bytes:
+                logger.warning(f"Repository is too large ({total_size / (1024*1024):.2f} MB)")
+                return False
+            
+            root = os.path.realpath(repo_path)
+            for info in members:
+                relative_name = info.filename.split("/", 1)[-1]
+                target = os.path.realpath(os.path.join(root, relative_name))
+                # Skip entries that would escape the repository directory
+                if not relative_name or not target.startswith(root + os.sep):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.open(info) as src, open(target, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        
+        return True
     
     async def _process_repository(self, session_id: uuid.UUID, repo_path: str):
         """Process repository files and generate embeddings"""
@@ -222,14 +473,60 @@ class EmbeddingService:
             
             # Limit number of files
             if len(files_to_process) > self.MAX_FILES_TO_PROCESS:
-                files_to_process = files_to_process[:self.MAX_FILES_TO_PROCESS]
+                files_to_process = dict(
+                    itertools.islice(files_to_process.items(), self.MAX_FILES_TO_PROCESS)
+                )
                 logger.warning(f"Limited to {self.MAX_FILES_TO_PROCESS} files")
             
-            embedding_count = 0
+            # Pipeline: read + chunk -> embed_queue -> embedding workers -> write_queue
+            # -> database writer. Bounded queues give backpressure between stages.
+            # The embedding stages share one database session; each use of it runs
+            # without yielding to the event loop, so they never interleave. The
+            # writer commits from a worker thread with a session of its own.
+            with Session(engine) as session:
+                embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+                write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+                embedders = [
+                    asyncio.create_task(
+                        self._embedding_stage(session, session_id, embed_queue, write_queue)
+                    )
+                    for _ in range(self.EMBEDDING_WORKERS)
+                ]
+                writer = asyncio.create_task(self._write_stage(write_queue))
+                
+                try:
+                    await self._chunking_stage(repo_path, files_to_process, embed_queue)
+                    for _ in embedders:
+                        await embed_queue.put(None)
+                    await asyncio.gather(*embedders)
+                    await write_queue.put(None)
+                    embedding_count = await writer
+                finally:
+                    for task in (*embedders, writer):
+                        task.cancel()
+                    # Let cancelled stages finish with the session before it closes
+                    await asyncio.gather(*embedders, writer, return_exceptions=True)
             
-            # Process each file
-            for file_path in files_to_process:
-                if embedding_count >= self.MAX_EMBEDDINGS_PER_SESSION:
+            logger.info(f"Generated {embedding_count} embeddings for session {session_id}")
+            
+        except RepoTooLargeError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing repository: {e}")
+            raise
+    
+    async def _chunking_stage(
+        self, repo_path: str, files_to_process: Dict[str, str], embed_queue: asyncio.Queue
+    ) -> None:
+        """Pipeline stage: read and chunk files, putting full batches on embed_queue"""
+        # Chunks waiting to be batched: (relative_path, chunk_index, chunk, file_metadata)
+        pending = []
+        queued = 0
+        
+        # Reads run ahead in threads while earlier files are chunked
+        async with aclosing(self._read_files(files_to_process)) as file_contents:
+            async for file_path, content in file_contents:
+                if queued + len(pending) >= self.MAX_EMBEDDINGS_PER_SESSION:
                     logger.warning(f"Reached maximum embeddings limit ({self.MAX_EMBEDDINGS_PER_SESSION})")
                     break
                 
@@ -237,92 +534,302 @@ class EmbeddingService:
                     # Get relative path from repo root
                     relative_path = os.path.relpath(file_path, repo_path)
                     
-                    # Read file content
-                    content = await self._read_file_content(file_path)
                     if not content:
                         continue
                     
+                    # Every chunk of a file shares the metadata gathered during the scan
+                    file_metadata = files_to_process[file_path]
+                    
                     # Create chunks if content is large
-                    chunks = self._create_chunks(content, self.CHUNK_SIZE)
+                    chunks = itertools.islice(
+                        self._create_chunks(content, self.CHUNK_SIZE),
+                        self.MAX_EMBEDDINGS_PER_SESSION - queued - len(pending)
+                    )
                     
-                    # Generate embeddings for each chunk
                     for chunk_index, chunk in enumerate(chunks):
-                        if embedding_count >= self.MAX_EMBEDDINGS_PER_SESSION:
-                            break
-                        
-                        # Generate embedding vector
-                        embedding_vector = await self._generate_embedding(chunk)
-                        
-                        # Create embedding record
-                        embedding = CodeSearchEmbedding(
-                            session_id=session_id,
-                            file_path=relative_path,
-                            file_content=chunk,
-                            chunk_index=chunk_index,
-                            chunk_size=len(chunk),
-                            embedding_vector=embedding_vector,
-                            file_metadata=self._get_file_metadata(file_path)
-                        )
-                        
-                        # Save to database
-                        with Session(engine) as session:
-                            session.add(embedding)
-                            session.commit()
-                        
-                        embedding_count += 1
-                        
-                        # Small delay to avoid hitting rate limits too aggressively
-                        if self.genai_available and embedding_count % 10 == 0:
-                            await asyncio.sleep(0.1)  # 100ms delay every 10 embeddings
-                        
-                        # Log progress
-                        if embedding_count % 50 == 0:
-                            logger.info(f"Processed {embedding_count} embeddings for session {session_id}")
-                    
+                        pending.append((relative_path, chunk_index, chunk, file_metadata))
+                
                 except Exception as e:
                     logger.error(f"Error processing file {file_path}: {e}")
                     continue
+                
+                # Hand off full batches, which may span several files
+                while len(pending) >= self.EMBEDDING_BATCH_SIZE:
+                    batch = pending[:self.EMBEDDING_BATCH_SIZE]
+                    pending = pending[self.EMBEDDING_BATCH_SIZE:]
+                    queued += len(batch)
+                    await embed_queue.put(batch)
+        
+        # Flush the last partial batch
+        if pending:
+            await embed_queue.put(pending)
+    
+    async def _embedding_stage(
+        self,
+        session: Session,
+        session_id: uuid.UUID,
+        embed_queue: asyncio.Queue,
+        write_queue: asyncio.Queue,
+    ) -> None:
+        """Pipeline stage: embed chunk batches until a None sentinel, passing rows to write_queue"""
+        while (batch := await embed_queue.get()) is not None:
+            rows = await self._embed_chunk_batch(session, session_id, batch)
+            if rows:
+                await write_queue.put(rows)
+    
+    async def _write_stage(self, write_queue: asyncio.Queue) -> int:
+        """Pipeline stage: insert row batches until a None sentinel; returns rows saved"""
+        saved = 0
+        while (rows := await write_queue.get()) is not None:
+            saved += await asyncio.to_thread(self._insert_rows, rows)
+        return saved
+    
+    @staticmethod
+    def _insert_rows(rows: List[Dict[str, Any]]) -> int:
+        """Insert and commit one batch of rows in its own session; returns rows saved"""
+        # Plain row dicts for a Core executemany insert; no ORM instances are
+        # needed since the rows are never read back here (id and created_at
+        # come from the column defaults)
+        with Session(engine) as session:
+            try:
+                session.execute(CodeSearchEmbedding.__table__.insert(), rows)
+                session.commit()
+                return len(rows)
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Error storing embeddings batch: {e}")
+                return 0
+    
+    async def _embed_chunk_batch(
+        self, session: Session, session_id: uuid.UUID, batch: List[tuple]
+    ) -> List[Dict[str, Any]]:
+        """Embed a batch of chunks with one API call and return the rows to insert"""
+        # Chunks are byte views into the file; decode them only now, for the API and the row
+        batch = [
+            (relative_path, chunk_index, text, file_metadata)
+            for relative_path, chunk_index, chunk, file_metadata in batch
+            if (text := str(chunk, 'utf-8', 'ignore')).strip()
+        ]
+        if not batch:
+            return []
+        
+        # Chunks already embedded in any session are served from the cache
+        content_hashes = [self._content_hash(chunk) for _, _, chunk, _ in batch]
+        try:
+            self._load_stored_embeddings(session, content_hashes)
+        except Exception as e:
+            session.rollback()
+            logger.warning(f"Could not look up stored embeddings by content hash: {e}")
+        
+        try:
+            embedding_vectors = await self._generate_embeddings_batch(
+                [chunk for _, _, chunk, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Error generating embeddings for a batch of {len(batch)} chunks: {e}")
+            return []
+        
+        return [
+            {
+                "session_id": session_id,
+                "file_path": relative_path,
+                "file_content": chunk,
+                "chunk_index": chunk_index,
+                "chunk_size": len(chunk),
+                "embedding_vector": embedding_vector,
+                "file_metadata": file_metadata,
+                "content_hash": content_hash,
+            }
+            for (relative_path, chunk_index, chunk, file_metadata), embedding_vector, content_hash
+            in zip(batch, embedding_vectors, content_hashes)
+        ]
+    
+    def _load_stored_embeddings(self, session: Session, content_hashes: List[str]) -> None:
+        """Copy vectors already stored for any of these content hashes into the cache"""
+        missing = [h for h in set(content_hashes) if h not in self._embedding_cache]
+        if not missing:
+            return
+        
+        rows = session.exec(
+            select(CodeSearchEmbedding.content_hash, CodeSearchEmbedding.embedding_vector)
+            .where(
+                col(CodeSearchEmbedding.content_hash).in_(missing),
+                col(CodeSearchEmbedding.embedding_vector).is_not(None)
+            )
+            .distinct(CodeSearchEmbedding.content_hash)
+        ).all()
+        for content_hash, embedding_vector in rows:
+            self._cache_embedding(content_hash, np.asarray(embedding_vector.to_numpy(), dtype=np.float16))
+    
+    @classmethod
+    def _content_hash(cls, text: str) -> str:
+        """Cache key for text; includes the model so a model change never reuses stale vectors"""
+        key = f"{cls.EMBEDDING_MODEL}|{text}"
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+    
+    def _cache_embedding(
+        self,
+        content_hash: str,
+        embedding: np.ndarray,
+        fingerprint: Optional[Tuple[int, np.ndarray, int]] = None,
+    ) -> None:
+        evicted = self._embedding_cache.put(content_hash, embedding)
+        if evicted is not None:
+            self._unindex_simhash(evicted)
+        if fingerprint is not None and content_hash not in self._fuzzy_fingerprints:
+            self._fuzzy_fingerprints[content_hash] = fingerprint
+            for band in self._simhash_bands(fingerprint[0]):
+                self._simhash_index.setdefault(band, []).append((fingerprint[0], content_hash))
+            if len(self._fuzzy_fingerprints) > self.FUZZY_CACHE_SIZE:
+                self._unindex_simhash(next(iter(self._fuzzy_fingerprints)))
+    
+    def _unindex_simhash(self, content_hash: str) -> None:
+        fingerprint = self._fuzzy_fingerprints.pop(content_hash, None)
+        if fingerprint is None:
+            return
+        signature = fingerprint[0]
+        for band in self._simhash_bands(signature):
+            entries = self._simhash_index[band]
+            entries.remove((signature, content_hash))
+            if not entries:
+                del self._simhash_index[band]
+    
+    @classmethod
+    def _simhash_bands(cls, signature: int) -> Iterator[Tuple[int, int]]:
+        band_bits = 64 // cls.SIMHASH_BANDS
+        mask = (1 << band_bits) - 1
+        for band in range(cls.SIMHASH_BANDS):
+            yield band, (signature >> (band * band_bits)) & mask
+    
+    @classmethod
+    def _simhash(cls, content: str) -> int:
+        """64-bit SimHash over whitespace-token 3-grams; near-duplicate text differs in few bits"""
+        return cls._fingerprint(content)[0]
+    
+    @staticmethod
+    def _fingerprint(content: str) -> Tuple[int, np.ndarray, int]:
+        """SimHash signature, sorted distinct shingle hashes and token count of content"""
+        tokens = content.split()
+        shingles = [
+            " ".join(tokens[i:i + 3]) for i in range(max(len(tokens) - 2, 1))
+        ]
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+                for shingle in shingles
+            ),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        # Each bit of the signature is the majority vote of that bit across shingles
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        majority = bits.sum(axis=0, dtype=np.int64) * 2 > len(shingles)
+        signature = int(np.packbits(majority, bitorder='little').view('<u8')[0])
+        return signature, np.unique(hashes), len(tokens)
+    
+    def _is_near_duplicate(
+        self, a: Tuple[int, np.ndarray, int], b: Tuple[int, np.ndarray, int]
+    ) -> bool:
+        """
+        Confirm a SimHash match. The majority vote alone lets text dominated by one
+        repeated shingle collide with unrelated text sharing that boilerplate.
+        """
+        (_, shingles_a, tokens_a), (_, shingles_b, tokens_b) = a, b
+        if min(tokens_a, tokens_b) < self.FUZZY_CACHE_MIN_SIMILARITY * max(tokens_a, tokens_b):
+            return False
+        shared = np.intersect1d(shingles_a, shingles_b, assume_unique=True).size
+        union = shingles_a.size + shingles_b.size - shared
+        return shared >= self.FUZZY_CACHE_MIN_SIMILARITY * union
+    
+    def _fuzzy_cache_lookup(self, fingerprint: Tuple[int, np.ndarray, int]) -> Optional[np.ndarray]:
+        """Return a cached embedding for confirmed near-duplicate text within FUZZY_CACHE_MAX_DISTANCE bits"""
+        signature = fingerprint[0]
+        seen = set()
+        for band in self._simhash_bands(signature):
+            for candidate, content_hash in self._simhash_index.get(band, ()):
+                if content_hash in seen:
+                    continue
+                seen.add(content_hash)
+                if (
+                    (candidate ^ signature).bit_count() <= self.FUZZY_CACHE_MAX_DISTANCE
+                    and self._is_near_duplicate(fingerprint, self._fuzzy_fingerprints[content_hash])
+                ):
+                    embedding = self._embedding_cache.get(content_hash)
+                    if embedding is not None:
+                        return embedding
+        return None
+    
+    def _scan_files(
+        self, root: str, skip_dir: Optional[Callable[[str], bool]] = None
+    ) -> Iterator[os.DirEntry]:
+        """
+        Yield file entries under root in os.walk's top-down order, using os.scandir so
+        each entry's type and stat come from the directory listing instead of extra
+        syscalls. Directories for which skip_dir(name) is true are not entered.
+        """
+        pending_dirs = [root]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = list(it)
+            except OSError:
+                continue
             
-            logger.info(f"Generated {embedding_count} embeddings for session {session_id}")
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if skip_dir is None or not skip_dir(entry.name):
+                            subdirs.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                except OSError:
+                    continue
             
-        except Exception as e:
-            logger.error(f"Error processing repository: {e}")
-            raise
+            # Visit subdirectories in listing order
+            pending_dirs.extend(reversed(subdirs))
     
-    async def _get_files_to_process(self, repo_path: str) -> List[str]:
-        """Get list of files to process from repository"""
-        files_to_process = []
+    async def _get_files_to_process(self, repo_path: str) -> Dict[str, str]:
+        """
+        Get files to process from repository, mapped to their metadata as a JSON string.
+        Raises RepoTooLargeError as soon as the files seen exceed MAX_REPO_SIZE_MB.
+        """
+        files_to_process = {}
+        max_repo_bytes = self.MAX_REPO_SIZE_MB * 1024 * 1024
+        total_bytes = 0
         
         try:
-            for root, dirs, files in os.walk(repo_path):
-                # Skip common directories that shouldn't be processed
-                dirs[:] = [d for d in dirs if not d.startswith('.') and d not in {
-                    'node_modules', '__pycache__', '.git', '.vscode', '.idea',
-                    'build', 'dist', 'target', 'bin', 'obj', 'venv', 'env'
-                }]
+            # Skip hidden and common directories that shouldn't be processed
+            for entry in self._scan_files(repo_path, _skip_dir):
+                file = entry.name
+                file_path = entry.path
                 
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    
-                    # Skip hidden files and large files
-                    if file.startswith('.'):
-                        continue
-                    
-                    try:
-                        file_size = os.path.getsize(file_path)
-                        if file_size > self.MAX_FILE_SIZE_KB * 1024:
-                            continue
-                    except (OSError, IOError):
-                        continue
-                    
-                    # Check file extension
-                    ext = Path(file).suffix.lower()
-                    if ext in self.SUPPORTED_EXTENSIONS:
-                        files_to_process.append(file_path)
-                    elif not ext and self._is_text_file(file_path):
-                        # Handle files without extensions that are text files
-                        files_to_process.append(file_path)
+                # Count every file towards the repository size, including skipped ones
+                try:
+                    stat = entry.stat()
+                except (OSError, IOError):
+                    continue
+                total_bytes += stat.st_size
+                if total_bytes > max_repo_bytes:
+                    raise RepoTooLargeError(total_bytes)
+                
+                # Skip hidden files and large files
+                if file.startswith('.') or stat.st_size > self.MAX_FILE_SIZE_KB * 1024:
+                    continue
+                
+                # Check file extension (or known extensionless name), and
+                # handle files without extensions that are text files
+                supported = _classify_file_name(file)
+                if supported or (supported is None and self._is_text_file(file_path)):
+                    files_to_process[file_path] = json.dumps({
+                        'file_size': stat.st_size,
+                        'file_extension': os.path.splitext(file)[1],
+                        'last_modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                    })
         
+        except RepoTooLargeError:
+            raise
         except Exception as e:
             logger.error(f"Error getting files to process: {e}")
         
@@ -346,99 +853,243 @@ class EmbeddingService:
         except:
             return False
     
-    async def _read_file_content(self, file_path: str) -> Optional[str]:
-        """Read file content safely"""
+    async def _read_files(self, file_paths: Iterable[str]) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+        """Yield (file_path, content) in order, reading up to FILE_READ_PREFETCH files ahead"""
+        paths = iter(file_paths)
+        in_flight = deque()
+        
+        def schedule_next():
+            file_path = next(paths, None)
+            if file_path is not None:
+                in_flight.append((file_path, asyncio.create_task(self._read_file_content(file_path))))
+        
+        for _ in range(self.FILE_READ_PREFETCH):
+            schedule_next()
+        
         try:
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            while in_flight:
+                file_path, read = in_flight.popleft()
+                schedule_next()
+                yield file_path, await read
+        finally:
+            for _, read in in_flight:
+                read.cancel()
+    
+    async def _read_file_content(self, file_path: str) -> Optional[bytes]:
+        """Read raw file content safely"""
+        return await asyncio.to_thread(self._read_file_content_sync, file_path)
+    
+    def _read_file_content_sync(self, file_path: str) -> Optional[bytes]:
+        """Read raw file content (blocking); chunks are decoded as UTF-8 when embedded"""
+        try:
+            with open(file_path, 'rb') as f:
                 return f.read()
         except Exception as e:
             logger.error(f"Error reading file {file_path}: {e}")
             return None
     
-    def _create_chunks(self, content: str, chunk_size: int) -> List[str]:
-        """Create chunks from content"""
+    def _create_chunks(self, content: bytes, chunk_size: int) -> Iterator[memoryview]:
+        """
+        Yield chunks of UTF-8 content as zero-copy memoryview slices, lazily so callers
+        can stop early. chunk_size is in bytes, which equals characters for ASCII code.
+        """
+        view = memoryview(content)
         if len(content) <= chunk_size:
-            return [content]
+            yield view
+            return
         
-        chunks = []
         start = 0
         while start < len(content):
             end = start + chunk_size
             # Try to break at word boundaries
             if end < len(content):
-                # Look for newline or space within last 100 characters
-                last_newline = content.rfind('\n', start, end)
-                last_space = content.rfind(' ', start, end)
-                
+                # Look for newline or space within last 100 bytes
+                window_start = max(start, end - 100)
+                last_newline = content.rfind(b'\n', window_start, end)
                 if last_newline > start:
                     end = last_newline
-                elif last_space > start:
-                    end = last_space
+                else:
+                    last_space = content.rfind(b' ', window_start, end)
+                    if last_space > start:
+                        end = last_space
+                    else:
+                        # Hard cut: back up so a multi-byte UTF-8 character is not split
+                        while end > start + 1 and (content[end] & 0xC0) == 0x80:
+                            end -= 1
             
-            chunks.append(content[start:end])
+            yield view[start:end]
             start = end
+    
+    @staticmethod
+    def _count_tokens(text: str) -> int:
+        """Approximate model token count (about 4 characters per word or symbol piece)"""
+        return sum(
+            (len(piece) + 3) // 4 for piece in _TOKEN_PIECE_RE.findall(text)
+        )
+    
+    def _truncate_to_token_limit(self, content: str) -> str:
+        """Cut content at the approximate MODEL_TOKEN_LIMIT token boundary"""
+        # Every token spans at least one character, so short texts always fit
+        if len(content) <= self.MODEL_TOKEN_LIMIT:
+            return content
         
-        return chunks
+        tokens = 0
+        for match in _TOKEN_PIECE_RE.finditer(content):
+            piece_tokens = (match.end() - match.start() + 3) // 4
+            if tokens + piece_tokens > self.MODEL_TOKEN_LIMIT:
+                # Cut inside the crossing piece, which may be one long run
+                # such as base64 or minified code, rather than before it
+                return content[:match.start() + (self.MODEL_TOKEN_LIMIT - tokens) * 4]
+            tokens += piece_tokens
+        return content
     
     @weave.op()
     async def _generate_embedding(self, content: str) -> List[float]:
         """Generate embedding vector for content using Google Generative AI"""
+        embeddings = (await self._generate_embeddings_batch([content]))[0].tolist()
+        print(f"embeddings: {len(embeddings)} dimensions")
+        
+        return embeddings
+    
+    async def _generate_embedding_fp16(self, content: str) -> np.ndarray:
+        """Generate the embedding for content as a float16 array (768 * 2 bytes)"""
+        return (await self._generate_embeddings_batch([content]))[0]
+    
+    @staticmethod
+    def quantize_int8(vector: np.ndarray) -> Tuple[np.ndarray, float]:
+        """
+        Quantize an embedding to int8 with one symmetric scale per vector
+        (768 bytes plus the scale), the ingestion format for int8 ANN indexes.
+        Recover an approximation with dequantize_int8(quantized, scale).
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        scale = float(np.max(np.abs(vector))) / 127.0
+        if scale == 0.0:
+            # Blank content embeds to all zeros, which needs no scale
+            return np.zeros(vector.shape, dtype=np.int8), 0.0
+        quantized = np.rint(vector / scale).clip(-128, 127).astype(np.int8)
+        return quantized, scale
+    
+    @staticmethod
+    def dequantize_int8(quantized: np.ndarray, scale: float) -> np.ndarray:
+        """Reconstruct a float32 embedding from quantize_int8 output"""
+        return quantized.astype(np.float32) * np.float32(scale)
+    
+    async def _embed_contents(self, contents: List[str]) -> List[List[float]]:
+        """Call the embedding API once for a list of texts"""
+        response = await self._client.aio.models.embed_content(
+            model=self.EMBEDDING_MODEL,
+            contents=contents,
+            config=genai_types.EmbedContentConfig(output_dimensionality=self.EMBEDDING_DIMENSIONS)
+        )
+        return [embedding.values for embedding in response.embeddings]
+    
+    async def _generate_embeddings_batch(
+        self, contents: List[str], batch_size: Optional[int] = None
+    ) -> List[np.ndarray]:
+        """
+        Generate embedding vectors for texts in order, reusing cached vectors.
+        Uncached texts are sent in API calls of at most batch_size texts
+        (default EMBEDDING_BATCH_SIZE). Vectors are quantized to float16,
+        matching the halfvec column they are stored in.
+        """
         if not self.genai_available:
             raise ValueError(
                 "Google API key not configured. Please set GOOGLE_API_KEY in environment variables "
                 "or settings to generate embeddings."
             )
         
-        # Retry logic for rate limiting
-        max_retries = 3
-        retry_delay = 1  # Start with 1 second
+        # Truncate content if too long (genai has token limits)
+        contents = [self._truncate_to_token_limit(content) for content in contents]
         
-        for attempt in range(max_retries):
-            try:
-                # Truncate content if too long (genai has token limits)
-                max_chars = 30000  # Conservative limit
-                if len(content) > max_chars:
-                    content = content[:max_chars]
-                    logger.debug(f"Truncated content to {max_chars} characters for embedding")
-                
-                # Generate embedding using Google Generative AI
-                response = genai.embed_content(
-                    model=self.EMBEDDING_MODEL,
-                    content=content,
-                    output_dimensionality=768
-                )
-
-                embeddings = response['embedding']
-                print(f"embeddings: {len(embeddings)} dimensions")
-                
-                return embeddings
-                
-            except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed for embedding generation: {e}")
-                
-                # Check if this is a rate limit error and we have retries left
-                if attempt < max_retries - 1:
-                    if "rate limit" in str(e).lower() or "quota" in str(e).lower():
-                        logger.info(f"Rate limited, retrying in {retry_delay} seconds...")
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                        continue
-                
-                # If all retries failed, raise the error
-                if attempt == max_retries - 1:
-                    logger.error(f"All {max_retries} attempts failed for embedding generation: {e}")
-                    raise RuntimeError(f"Failed to generate embedding after {max_retries} attempts: {e}") from e
+        # Only texts not seen before go to the API, each once per call
+        content_hashes = [self._content_hash(content) for content in contents]
+        embeddings: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        fingerprints: Dict[str, Tuple[int, np.ndarray, int]] = {}
+        for content_hash, content in zip(content_hashes, contents):
+            # Nothing to embed in blank text, so skip the round trip
+            if not content.strip():
+                embeddings[content_hash] = np.zeros(self.EMBEDDING_DIMENSIONS, dtype=np.float16)
+                continue
+            cached = self._embedding_cache.get(content_hash)
+            if cached is None and self.FUZZY_CACHE_ENABLED and content_hash not in missing:
+                fingerprint = fingerprints[content_hash] = self._fingerprint(content)
+                cached = self._fuzzy_cache_lookup(fingerprint)
+                if cached is not None:
+                    # Keep it under the exact hash too, but never index it, so
+                    # a chain of small edits cannot drift from the original
+                    self._cache_embedding(content_hash, cached)
+            if cached is not None:
+                embeddings[content_hash] = cached
+            else:
+                missing.setdefault(content_hash, content)
+        
+        if missing:
+            batch_size = batch_size or self.EMBEDDING_BATCH_SIZE
+            items = list(missing.items())
+            if len(items) > batch_size:
+                # Group texts of similar length into each request; results are
+                # matched back by content hash, so caller order is unaffected
+                items.sort(key=lambda item: self._count_tokens(item[1]))
+            texts = [text for _, text in items]
+            batches = await asyncio.gather(*(
+                self._request_embeddings(texts[start:start + batch_size])
+                for start in range(0, len(texts), batch_size)
+            ))
+            vectors = itertools.chain.from_iterable(batches)
+            for (content_hash, _), vector in zip(items, vectors):
+                vector = np.asarray(vector, dtype=np.float16)
+                self._cache_embedding(content_hash, vector, fingerprints.get(content_hash))
+                embeddings[content_hash] = vector
+        
+        return [embeddings[content_hash] for content_hash in content_hashes]
     
-    def _get_file_metadata(self, file_path: str) -> str:
-        """Get file metadata as JSON string"""
+    async def _request_embeddings(self, contents: List[str]) -> List[List[float]]:
+        """Call the embedding API for a batch of texts, with retries on rate limits"""
+        loop = asyncio.get_running_loop()
+        if self._request_semaphore_loop is not loop:
+            # The client's async connection pool is tied to the loop that used it
+            old_loop, old_transport = self._request_semaphore_loop, self._http_transport
+            if old_loop is not None:
+                self._client = self._create_client(self._api_key)
+            self._request_semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_EMBEDDING_REQUESTS)
+            self._request_limiter = AsyncRateLimiter(settings.EMBED_RPM, 60)
+            self._request_semaphore_loop = loop
+            # Close the replaced pool only after switching over, so concurrent
+            # callers on this loop never see a half-rebuilt client
+            if old_loop is not None and old_transport is not None:
+                await self._close_transport(old_transport, old_loop)
+        
+        # Jittered exponential backoff keeps concurrent batches from retrying in
+        # lockstep; a longer Retry-After from the API takes precedence
+        backoff = wait_random_exponential(
+            multiplier=self.EMBEDDING_RETRY_MULTIPLIER, max=self.EMBEDDING_RETRY_MAX_WAIT
+        )
+        
+        def wait(retry_state: RetryCallState) -> float:
+            retry_after = _retry_after_seconds(retry_state.outcome.exception())
+            return max(backoff(retry_state), retry_after or 0)
+        
+        def log_retry(retry_state: RetryCallState) -> None:
+            logger.info(
+                f"Rate limited on attempt {retry_state.attempt_number}, "
+                f"retrying in {retry_state.next_action.sleep:.2f} seconds..."
+            )
+        
+        attempt_number = 0
         try:
-            stat = os.stat(file_path)
-            metadata = {
-                'file_size': stat.st_size,
-                'file_extension': Path(file_path).suffix,
-                'last_modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            }
-            return str(metadata)
+            async for attempt in AsyncRetrying(
+                retry=retry_if_exception(_is_rate_limit_error),
+                wait=wait,
+                stop=stop_after_attempt(self.EMBEDDING_MAX_ATTEMPTS),
+                before_sleep=log_retry,
+                reraise=True,
+            ):
+                attempt_number = attempt.retry_state.attempt_number
+                with attempt:
+                    async with self._request_semaphore, self._request_limiter:
+                        return await self._embed_contents(contents)
         except Exception as e:
-            logger.error(f"Error getting file metadata: {e}")
-            return "{}" 
+            logger.error(f"All {attempt_number} attempts failed for embedding generation: {e}")
+            raise RuntimeError(f"Failed to generate embedding after {attempt_number} attempts: {e}") from e
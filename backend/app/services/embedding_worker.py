@@ -0,0 +1,64 @@
+"""
+Embedding Worker
+Runs embedding generation jobs on a dedicated thread and event loop so
+long clone + embed jobs never run on the HTTP worker's loop or threadpool
+"""
+
+import asyncio
+import logging
+import threading
+import uuid
+from concurrent.futures import Future
+from typing import Optional
+
+from app.services.embedding_service import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingWorker:
+    """In-process job queue for embedding generation"""
+
+    def __init__(self):
+        self.embedding_service = EmbeddingService()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Start the worker thread and its event loop on first use"""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever,
+                    name="embedding-worker",
+                    daemon=True,
+                )
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def enqueue(self, session_id: uuid.UUID, github_url: str) -> Future:
+        """Schedule embedding generation for a session and return immediately"""
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            self.embedding_service.generate_embeddings_for_session(session_id, github_url),
+            loop,
+        )
+        future.add_done_callback(
+            lambda f: self._log_failure(f, session_id)
+        )
+        logger.info(f"Queued embedding generation for session {session_id}")
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future, session_id: uuid.UUID) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                f"Embedding generation failed for session {session_id}: {future.exception()}"
+            )
+
+
+# Global embedding worker instance
+embedding_worker = EmbeddingWorker()
@@ -0,0 +1,57 @@
+"""
+Rate Limiter
+Async token bucket for pacing outbound API requests to a provider quota
+"""
+
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket allowing `max_rate` acquisitions per `time_period` seconds.
+
+    The bucket starts full, so a burst of up to `max_rate` requests goes out
+    immediately; after that, tokens refill continuously and waiters are
+    released in FIFO order as each token becomes available.
+
+    Usage:
+        limiter = AsyncRateLimiter(1500, 60)
+        async with limiter:
+            await call_api()
+    """
+
+    def __init__(self, max_rate: float, time_period: float = 60.0):
+        if max_rate <= 0 or time_period <= 0:
+            raise ValueError("max_rate and time_period must be positive")
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._refill_per_second = max_rate / time_period
+        self._tokens = float(max_rate)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_rate,
+            self._tokens + (now - self._updated_at) * self._refill_per_second,
+        )
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        # Holding the lock while sleeping keeps waiters in arrival order
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._refill_per_second)
+                self._refill()
+            self._tokens -= 1
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
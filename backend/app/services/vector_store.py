@@ -0,0 +1,98 @@
+"""
+Vector Store
+LRU cache of fixed-width vectors kept in a memory-mapped file instead of
+on the Python heap
+"""
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class MemmapVectorStore:
+    """
+    Up to `max_size` vectors of `dimensions` values, keyed by string.
+
+    Rows live in one contiguous `np.memmap` file, so the OS pages them in on
+    demand and the garbage collector never walks them; only the key -> row
+    index map is held in Python. The file starts at `initial_capacity` rows
+    and doubles when full. Once `max_size` is reached, the least recently
+    used key is evicted and its row reused.
+
+    Usage:
+        store = MemmapVectorStore("/tmp/vectors.f16", 768, 10000)
+        store.put(content_hash, vector)
+        vector = store.get(content_hash)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dimensions: int,
+        max_size: int,
+        dtype=np.float16,
+        initial_capacity: int = 1024,
+    ):
+        if dimensions <= 0 or max_size <= 0:
+            raise ValueError("dimensions and max_size must be positive")
+        self.path = path
+        self.dimensions = dimensions
+        self.max_size = max_size
+        self.dtype = np.dtype(dtype)
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._capacity = min(initial_capacity, max_size)
+        self._vectors = np.memmap(
+            path, dtype=self.dtype, mode="w+", shape=(self._capacity, dimensions)
+        )
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return a copy of the vector for key, or None, marking it recently used"""
+        row = self._index.get(key)
+        if row is None:
+            return None
+        self._index.move_to_end(key)
+        # Copy, since the row is overwritten once the key is evicted
+        return np.array(self._vectors[row])
+
+    def put(self, key: str, vector) -> Optional[str]:
+        """
+        Store vector under key, evicting the least recently used key if full.
+        Returns the evicted key, if any.
+        """
+        evicted = None
+        row = self._index.get(key)
+        if row is None:
+            evicted, row = self._allocate_row()
+            self._index[key] = row
+        else:
+            self._index.move_to_end(key)
+        self._vectors[row] = np.asarray(vector, dtype=self.dtype)
+        return evicted
+
+    def flush(self) -> None:
+        """Write pending changes so other processes mapping the file see them"""
+        self._vectors.flush()
+
+    def _allocate_row(self) -> Tuple[Optional[str], int]:
+        if len(self._index) < self._capacity:
+            return None, len(self._index)
+        if self._capacity < self.max_size:
+            self._grow(min(self._capacity * 2, self.max_size))
+            return None, len(self._index)
+        return self._index.popitem(last=False)
+
+    def _grow(self, capacity: int) -> None:
+        # Remapping in r+ mode extends the file in place; rows keep their index
+        self._vectors.flush()
+        self._vectors = np.memmap(
+            self.path, dtype=self.dtype, mode="r+", shape=(capacity, self.dimensions)
+        )
+        self._capacity = capacity
+
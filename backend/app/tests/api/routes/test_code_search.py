@@ -0,0 +1,34 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.api.routes.code_search import parse_github_url
+from app.core.config import settings
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("https://github.com/owner/repo", "owner/repo"),
+        ("http://github.com/owner/repo/", "owner/repo"),
+        ("https://github.com/owner/repo?tab=readme#top", "owner/repo"),
+        ("https://github.com/", None),
+        ("https://github.com/?tab=x", None),
+        ("https://github.com/owner", None),
+        ("https://gitlab.com/owner/repo", None),
+    ],
+)
+def test_parse_github_url(url: str, expected: str | None) -> None:
+    assert parse_github_url(url) == expected
+
+
+@pytest.mark.parametrize("url", ["https://github.com/", "https://github.com/?tab=x"])
+def test_create_session_rejects_bare_github_url(
+    client: TestClient, normal_user_token_headers: dict[str, str], url: str
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/code-search/sessions",
+        headers=normal_user_token_headers,
+        json={"name": "Bare host", "github_url": url},
+    )
+    assert response.status_code == 400
+    assert "Invalid GitHub URL" in response.json()["detail"]
@@ -1,70 +1,121 @@
 """
-Tests for EmbeddingService to verify REAL embedding functionality.
-These tests use the actual Google API key from settings to generate real embeddings.
-NO MOCKS - REAL EMBEDDINGS ONLY!
+Tests for EmbeddingService.
+Tests that check embedding vectors replay Google API responses recorded with
+the API key from settings, some wrapping _embed_contents to count its calls.
+Tests of empty content, cache reuse, retries and concurrency replace
+_embed_contents with stubs that return fixed vectors or raise, and need no
+recording.
+
+API responses are recorded under cassettes/test_embedding_service/ and replayed;
+by default no request reaches the network. Tests that need a recording are
+skipped until the cassette exists, and one with no recording in it fails.
+Set LIVE_EMBEDDINGS=1 to call the API and re-record them, then commit the
+cassette. Live runs first send one warm-up request, so connection setup (~400ms)
+is not charged to the first test. Set PYTEST_EMBEDDING_WARM=0 to skip it.
 """
 
+import asyncio
+import math
+import os
+import random
+import time
+from pathlib import Path
+
+import numpy as np
 import pytest
+from google.genai import errors as genai_errors
 from app.services.embedding_service import EmbeddingService
+from app.services.vector_store import MemmapVectorStore
 from app.core.config import settings
+from app.tests.utils.embedding import EmbeddingCassette, assert_valid_embedding
+
+
+# The module-scoped service is built once per worker, so under
+# `pytest -n auto --dist loadgroup` these tests stay together on one worker.
+# Async tests run through the anyio pytest plugin (anyio ships with httpx).
+pytestmark = [pytest.mark.xdist_group("embedding"), pytest.mark.anyio]
+
+
+LIVE_EMBEDDINGS = os.getenv("LIVE_EMBEDDINGS") == "1"
+# Open the API connection before the first test so its timing excludes DNS and TLS setup
+WARM_EMBEDDING_CLIENT = os.getenv("PYTEST_EMBEDDING_WARM", "1") == "1"
+CASSETTE_PATH = Path(__file__).parent / "cassettes" / "test_embedding_service" / "embeddings.json"
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    """Run the module's async tests on one asyncio loop, kept open by the service fixture"""
+    return "asyncio"
+
+
+@pytest.fixture(scope="module")
+def cassette():
+    """Recorded API responses for every service in this module, saved once when recording"""
+    cassette = EmbeddingCassette(CASSETTE_PATH, record=LIVE_EMBEDDINGS)
+    yield cassette
+    cassette.save()
+
+
+@pytest.fixture(scope="module")
+async def service(anyio_backend, cassette):
+    """
+    One EmbeddingService shared by the tests in this module, replaying recorded API responses.
+    Being an async module-scoped fixture, it keeps a single event loop (and with it the
+    client's pooled connections) alive across the module's tests.
+    """
+    async with EmbeddingService() as service:
+        if LIVE_EMBEDDINGS and WARM_EMBEDDING_CLIENT:
+            await service._embed_contents(["warmup"])
+        service._embed_contents = cassette.wrap(service.EMBEDDING_MODEL, service._embed_contents)
+        yield service
+
+
+@pytest.fixture(scope="session")
+def long_content():
+    """Content far above the model's input token limit, about 50,000 characters"""
+    return "This is a test sentence. " * 2000
+
+
+# Event loops seen by test_loop_scope
+_test_loops = []
 
 
 class TestEmbeddingService:
-    """Test suite for EmbeddingService - REAL EMBEDDINGS ONLY"""
+    """Test suite for EmbeddingService"""
     
-    def test_service_initialization(self):
-        """Test service initialization with real API key from settings"""
+    async def test_service_initialization(self, cassette):
+        """Test that a service built outside the shared fixture initializes, embeds and closes"""
         # This will use the REAL API key from settings.GOOGLE_API_KEY
         service = EmbeddingService()
+        service._embed_contents = cassette.wrap(service.EMBEDDING_MODEL, service._embed_contents)
+        try:
+            assert service.genai_available is True
+            assert os.path.isdir(service.temp_dir)
+            
+            embedding = await service._generate_embedding("def initialized(): return True")
+            assert_valid_embedding(embedding)
+        finally:
+            await service.aclose()
         
-        # Should initialize successfully with real API key
-        assert service.genai_available is True
-        assert hasattr(service, 'temp_dir')
-        assert service.EMBEDDING_MODEL == "models/text-embedding-004"
-        
-        # Clean up
-        service.__del__()
+        # aclose() releases the connection pool and removes the temp directory
+        assert not os.path.exists(service.temp_dir)
     
-    def test_supported_extensions(self):
-        """Test that supported extensions are defined correctly"""
-        service = EmbeddingService()
-        
-        # Should have supported extensions
-        assert hasattr(service, 'SUPPORTED_EXTENSIONS')
-        assert isinstance(service.SUPPORTED_EXTENSIONS, set)
-        assert '.py' in service.SUPPORTED_EXTENSIONS
-        assert '.js' in service.SUPPORTED_EXTENSIONS
-        assert '.ts' in service.SUPPORTED_EXTENSIONS
-        assert '.java' in service.SUPPORTED_EXTENSIONS
-        assert '.cpp' in service.SUPPORTED_EXTENSIONS
-        
-        # Clean up
-        service.__del__()
-    
-    def test_constants(self):
-        """Test that service constants are defined"""
-        service = EmbeddingService()
-        
-        # Check important constants exist
-        assert hasattr(service, 'MAX_REPO_SIZE_MB')
-        assert hasattr(service, 'MAX_FILE_SIZE_KB')
-        assert hasattr(service, 'CHUNK_SIZE')
-        assert hasattr(service, 'EMBEDDING_MODEL')
-        
-        # Check values are reasonable
-        assert service.MAX_REPO_SIZE_MB > 0
-        assert service.MAX_FILE_SIZE_KB > 0
-        assert service.CHUNK_SIZE > 0
-        assert service.EMBEDDING_MODEL.startswith('models/')
-        
-        # Clean up
-        service.__del__()
+    @pytest.mark.parametrize("attr,pred", [
+        ("SUPPORTED_EXTENSIONS", lambda v: isinstance(v, set) and {".py", ".js", ".ts", ".java", ".cpp"} <= v),
+        ("MAX_REPO_SIZE_MB", lambda v: v > 0),
+        ("MAX_FILE_SIZE_KB", lambda v: v > 0),
+        ("CHUNK_SIZE", lambda v: v > 0),
+        ("EMBEDDING_MODEL", lambda v: v == "models/text-embedding-004"),
+        # Initialized with the real API key from settings.GOOGLE_API_KEY
+        ("genai_available", lambda v: v is True),
+        ("temp_dir", os.path.isdir),
+    ])
+    def test_service_attributes(self, service, attr, pred):
+        """Test service configuration and initialization state on the shared service"""
+        assert pred(getattr(service, attr))
     
-    @pytest.mark.asyncio
-    async def test_real_embedding_generation(self):
+    async def test_real_embedding_generation(self, service):
         """Test REAL embedding generation with actual Google GenAI API"""
-        service = EmbeddingService()
-        
         # Test with real content
         test_content = """
         def calculate_fibonacci(n):
@@ -78,46 +129,162 @@ class TestEmbeddingService:
         # Generate REAL embedding using Google API
         embedding = await service._generate_embedding(test_content)
         
-        # Verify embedding properties
+        # Verify embedding properties: 768 dimensions for text-embedding-004,
+        # values reasonable (not all zeros or ones)
         assert isinstance(embedding, list)
-        assert len(embedding) == 768  # Expected dimension for text-embedding-004
-        assert all(isinstance(x, float) for x in embedding)
-        
-        # Verify embedding values are reasonable (not all zeros or ones)
-        assert not all(x == 0.0 for x in embedding)
-        assert not all(x == 1.0 for x in embedding)
-        assert any(-1.0 <= x <= 1.0 for x in embedding)  # Values should be normalized
+        embedding_array = np.asarray(embedding)
+        assert embedding_array.dtype == np.float64
+        assert_valid_embedding(embedding_array)
         
         # Test with different content to ensure different embeddings
         different_content = "This is completely different text about weather and climate patterns."
         different_embedding = await service._generate_embedding(different_content)
         
         # Different content should produce different embeddings
-        assert embedding != different_embedding
+        assert not np.array_equal(embedding_array, np.asarray(different_embedding))
         assert len(different_embedding) == 768
+    
+    async def test_fp16_embedding_roundtrip(self, service):
+        """Test that float16 embeddings survive a store/reload and match the list form"""
+        content = "def add(a, b): return a + b"
+        original = await service._generate_embedding(content)
+        fp16 = await service._generate_embedding_fp16(content)
+        assert fp16.dtype == np.float16
+        
+        # Store and reload as raw float16 bytes, as a halfvec column holds them
+        reloaded = np.frombuffer(fp16.tobytes(), dtype=np.float16)
         
-        # Clean up
-        service.__del__()
+        assert reloaded.nbytes == 768 * 2
+        assert np.allclose(original, reloaded.astype(np.float32), atol=1e-3)
     
-    @pytest.mark.asyncio 
-    async def test_content_truncation_with_real_api(self):
-        """Test that very long content is properly truncated and still generates real embeddings"""
-        service = EmbeddingService()
+    async def test_int8_quantization(self, service):
+        """Test that int8-quantized embeddings round-trip within tolerance at 1 byte per value"""
+        original = np.asarray(await service._generate_embedding("def add(a, b): return a + b"))
+        
+        quantized, scale = service.quantize_int8(original)
+        reconstructed = service.dequantize_int8(quantized, scale)
+        
+        assert quantized.dtype == np.int8
+        assert quantized.nbytes == 768
+        assert np.max(np.abs(original - reconstructed)) < 0.02
+        
+        # All-zero vectors (blank content) survive without a zero scale blowing up
+        zeros, zero_scale = service.quantize_int8(np.zeros(768))
+        assert not zeros.any()
+        assert not service.dequantize_int8(zeros, zero_scale).any()
+    
+    def test_memmap_vector_store(self, tmp_path):
+        """Test that cached vectors live in a growable file another process can map"""
+        path = str(tmp_path / "vectors.f16")
+        store = MemmapVectorStore(path, 768, 1000, initial_capacity=64)
+        vectors = np.random.default_rng(0).standard_normal((100, 768)).astype(np.float16)
+        for i, vector in enumerate(vectors):
+            store.put(f"key-{i}", vector)
+        store.flush()
+        
+        # Capacity doubles from 64 to 128 rows of 768 float16 values
+        assert len(store) == 100
+        assert os.path.getsize(path) == 128 * 768 * 2
+        assert np.array_equal(store.get("key-42"), vectors[42])
+        
+        # A read-only mapping, as a worker process would open it, sees the same rows
+        reopened = np.memmap(path, dtype=np.float16, mode="r", shape=(128, 768))
+        assert np.array_equal(reopened[:100], vectors)
+    
+    def test_memmap_vector_store_evicts_least_recently_used(self, tmp_path):
+        """Test that a full store reuses the row of its least recently used key"""
+        store = MemmapVectorStore(str(tmp_path / "vectors.f16"), 4, 2)
+        store.put("a", np.ones(4))
+        store.put("b", np.full(4, 2))
+        store.get("a")
+        store.put("c", np.full(4, 3))
+        
+        assert "b" not in store
+        assert np.array_equal(store.get("a"), np.ones(4))
+        assert np.array_equal(store.get("c"), np.full(4, 3))
+    
+    @pytest.mark.parametrize("call", range(2))
+    async def test_loop_scope(self, service, call):
+        """Test that async tests share one event loop instead of a new loop per test"""
+        _test_loops.append(asyncio.get_running_loop())
+        assert _test_loops[0] is _test_loops[-1]
+    
+    async def test_empty_content_short_circuits(self, service, monkeypatch):
+        """Test that empty and whitespace-only content never reaches the API"""
+        async def fail_embed_contents(contents):
+            raise AssertionError(f"Unexpected API call for {contents!r}")
+        
+        monkeypatch.setattr(service, "_embed_contents", fail_embed_contents)
+        
+        for content in ("", "   \n\t  "):
+            embedding = await service._generate_embedding(content)
+            assert embedding == [0.0] * 768
+    
+    async def test_fuzzy_cache_hits_on_minor_edit(self, service, monkeypatch):
+        """Test that a near-duplicate of cached text reuses its embedding without an API call"""
+        monkeypatch.setattr(service, "FUZZY_CACHE_ENABLED", True)
+        original = await service._generate_embedding_fp16("def f(): pass")
         
-        # Create content longer than 30000 characters
-        long_content = "This is a test sentence. " * 2000  # About 50,000 characters
+        async def fail_embed_contents(contents):
+            raise AssertionError(f"Unexpected API call for {contents!r}")
+        
+        monkeypatch.setattr(service, "_embed_contents", fail_embed_contents)
+        
+        edited = await service._generate_embedding_fp16("def f(): pass ")
+        assert np.array_equal(edited, original)
+    
+    async def test_fuzzy_cache_keeps_distinct_chunks_apart(self, service, monkeypatch):
+        """Test that chunks sharing repeated boilerplate never reuse each other's vector"""
+        monkeypatch.setattr(service, "FUZZY_CACHE_ENABLED", True)
+        
+        # Stub the API with a distinct vector per call
+        calls = 0
+        
+        async def counting_embed_contents(contents):
+            nonlocal calls
+            calls += 1
+            return [[calls / 10] * 768 for _ in contents]
+        
+        monkeypatch.setattr(service, "_embed_contents", counting_embed_contents)
+        
+        # The repeated line outvotes the rest, so both texts get the same SimHash
+        boilerplate = "x = 1\n" * 60
+        first = boilerplate + "def load_user(user_id): return db.get(user_id)"
+        second = boilerplate + "class PaymentGateway: charge = stripe.Charge.create"
+        assert service._simhash(first) == service._simhash(second)
+        
+        first_embedding = await service._generate_embedding_fp16(first)
+        second_embedding = await service._generate_embedding_fp16(second)
+        
+        assert calls == 2
+        assert not np.array_equal(first_embedding, second_embedding)
+    
+    async def test_content_truncation_with_real_api(self, service, long_content):
+        """Test that very long content is properly truncated and still generates real embeddings"""
+        truncated = service._truncate_to_token_limit(long_content)
+        assert long_content.startswith(truncated)
+        assert service._count_tokens(truncated) <= service.MODEL_TOKEN_LIMIT
+        assert service._count_tokens(long_content) > service.MODEL_TOKEN_LIMIT
         
         # Should still generate real embedding (truncated)
         embedding = await service._generate_embedding(long_content)
         
         assert isinstance(embedding, list)
-        assert len(embedding) == 768
-        assert all(isinstance(x, float) for x in embedding)
+        embedding_array = np.asarray(embedding)
+        assert embedding_array.dtype == np.float64
+        assert_valid_embedding(embedding_array)
+    
+    def test_truncation_cuts_inside_overlong_piece(self, service):
+        """Test that a single run longer than the token limit is cut, not dropped"""
+        truncated = service._truncate_to_token_limit("x" * 50000)
+        assert truncated == "x" * (service.MODEL_TOKEN_LIMIT * 4)
+        assert service._count_tokens(truncated) == service.MODEL_TOKEN_LIMIT
         
-        # Clean up  
-        service.__del__()
+        truncated = service._truncate_to_token_limit("data = '" + "A" * 50000 + "'")
+        assert truncated.startswith("data = 'AAAA")
+        assert service._count_tokens(truncated) == service.MODEL_TOKEN_LIMIT
     
-    def test_api_key_from_settings(self):
+    def test_api_key_from_settings(self, service):
         """Verify that the API key is properly loaded from settings"""
         # This tests that settings.GOOGLE_API_KEY is accessible and configured
         assert hasattr(settings, 'GOOGLE_API_KEY')
@@ -125,16 +292,30 @@ class TestEmbeddingService:
         assert len(settings.GOOGLE_API_KEY) > 20  # Real API keys are longer than 20 chars
         
         # Test service uses this API key
-        service = EmbeddingService()
         assert service.genai_available is True
+    
+    @pytest.mark.skipif(not LIVE_EMBEDDINGS, reason="Replayed responses open no connections; set LIVE_EMBEDDINGS=1")
+    async def test_http_keepalive_reused(self, service):
+        """Test that sequential API calls reuse one pooled keep-alive connection"""
+        for i in range(4):
+            await service._generate_embedding(f"Keep-alive test text number {i}")
         
-        # Clean up
-        service.__del__()
+        # Without keep-alive each call would open (and close) its own connection
+        connections = service._http_transport._pool.connections
+        assert len(connections) == 1
+        assert connections[0].is_available()
     
-    @pytest.mark.asyncio
-    async def test_embedding_consistency(self):
+    async def test_embedding_consistency(self, service, monkeypatch):
         """Test that the same content produces the same embedding consistently"""
-        service = EmbeddingService()
+        # Count real API calls made through the service's thin wrapper
+        api_calls = []
+        embed_contents = service._embed_contents
+        
+        async def counting_embed_contents(contents):
+            api_calls.append(len(contents))
+            return await embed_contents(contents)
+        
+        monkeypatch.setattr(service, "_embed_contents", counting_embed_contents)
         
         content = "def hello_world(): print('Hello, World!')"
         
@@ -142,10 +323,137 @@ class TestEmbeddingService:
         embedding1 = await service._generate_embedding(content)
         embedding2 = await service._generate_embedding(content)
         
-        # Should be exactly the same (Google's embedding model is deterministic)
-        assert embedding1 == embedding2
+        # Should be exactly the same, with the second served from the content-hash cache
+        assert np.array_equal(np.asarray(embedding1), np.asarray(embedding2))
+        assert len(api_calls) == 1
         assert len(embedding1) == 768
         assert len(embedding2) == 768
+    
+    async def test_batch_embedding_generation(self, service):
+        """Test that a batch of texts is embedded in one call, in input order"""
+        texts = [f"def function_{i}(): return {i} * {i}" for i in range(10)]
+        
+        embeddings = await service._generate_embeddings_batch(texts)
+        
+        assert len(embeddings) == 10
+        assert len(embeddings[0]) == 768
+        
+        # Each position must hold the embedding of the text at the same position
+        for text, embedding in zip(texts, embeddings):
+            assert embedding.tolist() == await service._generate_embedding(text)
+    
+    async def test_batch_respects_size_limit(self, service, monkeypatch):
+        """Test that large batches are split into API calls of at most batch_size texts"""
+        # Count real API calls made through the service's thin wrapper
+        api_calls = []
+        embed_contents = service._embed_contents
+        
+        async def counting_embed_contents(contents):
+            api_calls.append(len(contents))
+            return await embed_contents(contents)
+        
+        monkeypatch.setattr(service, "_embed_contents", counting_embed_contents)
+        
+        texts = [f"Batch size test sentence number {i}." for i in range(150)]
+        embeddings = await service._generate_embeddings_batch(texts, batch_size=64)
+        
+        assert len(embeddings) == 150
+        assert len(api_calls) == math.ceil(150 / 64)
+        assert max(api_calls) <= 64
+        assert sum(api_calls) == 150
+    
+    async def test_similar_length_batching_preserves_order(self, service, monkeypatch):
+        """Test that batches group texts of similar length without reordering results"""
+        rng = random.Random(0)
+        texts = [
+            f"Length test {i}: " + "tok " * rng.randint(10, 2000) for i in range(20)
+        ]
+        batch_size = 5
+        
+        # Record the token lengths sent in each real API call
+        batch_lengths = []
+        embed_contents = service._embed_contents
+        
+        async def recording_embed_contents(contents):
+            batch_lengths.append([service._count_tokens(text) for text in contents])
+            return await embed_contents(contents)
+        
+        monkeypatch.setattr(service, "_embed_contents", recording_embed_contents)
+        
+        embeddings = await service._generate_embeddings_batch(texts, batch_size=batch_size)
+        
+        assert len(embeddings) == 20
+        for text, embedding in zip(texts, embeddings):
+            assert embedding.tolist() == await service._generate_embedding(text)
+        
+        # Length spread per batch must beat batching in input order
+        input_lengths = [service._count_tokens(text) for text in texts]
+        unsorted_batches = [
+            input_lengths[start:start + batch_size]
+            for start in range(0, len(texts), batch_size)
+        ]
+        
+        def mean_spread(batches):
+            return sum(max(lengths) - min(lengths) for lengths in batches) / len(batches)
+        
+        assert len(batch_lengths) == 4
+        assert mean_spread(batch_lengths) < mean_spread(unsorted_batches)
+    
+    async def test_retry_on_429(self, service, monkeypatch):
+        """Test that rate-limited calls are retried with backoff until they succeed"""
+        monkeypatch.setattr(service, "EMBEDDING_RETRY_MULTIPLIER", 0.01)
+        
+        # Stub the API call to be rate limited twice before succeeding
+        calls = 0
+        
+        async def rate_limited_embed_contents(contents):
+            nonlocal calls
+            calls += 1
+            if calls <= 2:
+                raise genai_errors.ClientError(
+                    429,
+                    {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}},
+                )
+            return [[0.1] * 768 for _ in contents]
+        
+        monkeypatch.setattr(service, "_embed_contents", rate_limited_embed_contents)
+        
+        embeddings = await service._generate_embeddings_batch(["Retry test text"])
+        
+        assert calls == 3
+        assert len(embeddings[0]) == 768
+    
+    async def test_concurrent_batches_bounded(self, service, monkeypatch):
+        """Test that batches are dispatched concurrently, never above the in-flight limit"""
+        max_in_flight = 4
+        monkeypatch.setattr(service, "MAX_CONCURRENT_EMBEDDING_REQUESTS", max_in_flight)
+        # Earlier tests already built the semaphore on this loop; rebuild it
+        # with the patched limit, and restore the originals afterwards
+        for name in ("_request_semaphore", "_request_limiter", "_request_semaphore_loop"):
+            monkeypatch.setattr(service, name, None)
+        
+        # Stub the API call with fixed latency to measure overlap, not the network
+        in_flight = 0
+        peak_in_flight = 0
+        
+        async def slow_embed_contents(contents):
+            nonlocal in_flight, peak_in_flight
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+            try:
+                await asyncio.sleep(0.2)
+                return [[0.1] * 768 for _ in contents]
+            finally:
+                in_flight -= 1
+        
+        monkeypatch.setattr(service, "_embed_contents", slow_embed_contents)
+        
+        texts = [f"Concurrency test text {i}" for i in range(64)]
+        started = time.perf_counter()
+        embeddings = await service._generate_embeddings_batch(texts, batch_size=8)
+        elapsed = time.perf_counter() - started
         
-        # Clean up
-        service.__del__() 
+        assert len(embeddings) == 64
+        assert peak_in_flight == max_in_flight
+        # 8 batches of 200ms would take 1.6s back to back
+        assert elapsed < 8 * 0.2
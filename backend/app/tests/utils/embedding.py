@@ -0,0 +1,75 @@
+import hashlib
+import json
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+
+def assert_valid_embedding(embedding, dim: int = 768) -> None:
+    arr = np.asarray(embedding, dtype=np.float64)
+    assert arr.shape == (dim,)
+    # Not all zeros or ones, and values should be normalized
+    assert not np.all(arr == 0.0)
+    assert not np.all(arr == 1.0)
+    assert np.any((arr >= -1.0) & (arr <= 1.0))
+
+
+class MissingRecordingError(LookupError):
+    """A replay-only cassette has no recorded response for a request"""
+
+
+class EmbeddingCassette:
+    """
+    Embedding API responses recorded to a JSON file and replayed on later runs,
+    so test runs do not call the API.
+
+    By default the cassette is replay-only: a request with no recorded response
+    raises MissingRecordingError instead of reaching the network, and the
+    calling test is skipped when nothing has been recorded yet. With
+    record=True every call goes to the API, its response replaces the
+    recording, and save() writes the file to be committed.
+    """
+
+    def __init__(self, path: Path, record: bool = False) -> None:
+        self.path = path
+        self.record = record
+        self._responses: dict[str, list[list[float]]] = {}
+        self._dirty = False
+        if path.exists():
+            self._responses = json.loads(path.read_text())
+
+    @staticmethod
+    def _key(model: str, contents: list[str]) -> str:
+        payload = json.dumps([model, contents])
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def wrap(
+        self, model: str, embed_contents: Callable[[list[str]], Awaitable[list[list[float]]]]
+    ) -> Callable[[list[str]], Awaitable[list[list[float]]]]:
+        async def replay_or_record(contents: list[str]) -> list[list[float]]:
+            key = self._key(model, contents)
+            if not self.record:
+                if not self.path.exists():
+                    pytest.skip(f"No embedding cassette at {self.path}; record with LIVE_EMBEDDINGS=1")
+                if key not in self._responses:
+                    raise MissingRecordingError(
+                        f"No recorded embedding response for {len(contents)} text(s) "
+                        f"(first: {contents[0][:60]!r}) in {self.path}; "
+                        "re-record with LIVE_EMBEDDINGS=1"
+                    )
+                return self._responses[key]
+            response = [list(values) for values in await embed_contents(contents)]
+            self._responses[key] = response
+            self._dirty = True
+            return response
+
+        return replay_or_record
+
+    def save(self) -> None:
+        """Write new recordings; replay-only cassettes never touch the file"""
+        if self.record and self._dirty:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(self._responses, sort_keys=True))
+            self._dirty = False